@@ -0,0 +1,384 @@
+"""
+Benchmarks for the vectorized pipeline kernels on synthetic data.
+
+Each benchmark checks that the optimized implementation produces the same output as the
+previous row-by-row implementation (kept here as a reference) and reports throughput.
+Run with: python benchmarks.py
+"""
+import os
+import time
+import tempfile
+import ilthermopy
+import numpy as np
+import pandas as pd
+from step2_decode_data import docode_data
+from step5_place_smiles import initialize_columns, assign_smiles_and_ids
+from molecule_cache import MoleculeCache, describe_all, validate_tokenizer
+from dedup import drop_duplicate_keys
+from scipy.stats import linregress, t
+from step8_gibbs_helmholtz import gibbs_helmholtz_coefficients, gibbs_helmholtz_batch
+import step9_conflict_handling
+from step9_conflict_handling import process_row
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+# -------------------- Step2: column decoder --------------------
+def make_raw_data(n_rows, seed=0):
+    """Synthetic step1 measurement table with the V1-V4 layouts found in ILThermo activity entries."""
+    rng = np.random.default_rng(seed)
+    temperature = rng.uniform(280, 420, n_rows).round(2)
+    pressure = np.where(rng.random(n_rows) < 0.98, 101.325, 50.0)
+    mole_fraction = np.where(rng.random(n_rows) < 0.9, 0.0, rng.uniform(0.01, 0.5, n_rows)).round(4)
+    gamma = rng.lognormal(1.0, 1.0, n_rows).round(4)
+    no_fraction = rng.random(n_rows) < 0.3  # entries without a mole fraction column: gamma sits in V3
+    df = pd.DataFrame({
+        'id': rng.integers(0, max(1, n_rows // 20), n_rows).astype(str),
+        'solvent': np.where(rng.random(n_rows) < 0.05, 'Water', None),
+        'property': 'Activity coefficient',
+        'property_type': 'Activity, fugacity and osmotic properties',
+        'V1': temperature,
+        'V2': pressure,
+        'V3': np.where(no_fraction, gamma, mole_fraction),
+        'V4': np.where(no_fraction, np.nan, gamma),
+    })
+    return df
+
+
+def docode_data_reference(df):
+    """Previous row-by-row implementation of step2 docode_data (without the CSV writes)."""
+    df_copy = df.copy()
+    df_copy['original_index'] = df_copy.index
+    df_copy = df_copy[~df_copy['solvent'].str.lower().isin(['water', 'methanol', 'ethanol', 'propan-1-ol'])]
+    df_copy['temperature'] = None
+    df_copy['pressure'] = None
+    df_copy['mole_fraction'] = None
+    for index, row in df_copy.iterrows():
+        if pd.isna(row['V4']):
+            df_copy.loc[index, 'temp_gamma'] = row['V3']
+            df_copy.loc[index, 'V4'] = df_copy.loc[index, 'temp_gamma']
+            df_copy.loc[index, 'V3'] = None
+    df_copy['gamma'] = df_copy['V4']
+    df_copy = df_copy.drop(columns=['temp_gamma'], errors='ignore')
+    for col in ['V1', 'V2', 'V3']:
+        df_copy.loc[df_copy[col].between(98, 102, inclusive='both'), 'pressure'] = df_copy[col]
+        df_copy.loc[df_copy[col] > 250, 'temperature'] = df_copy[col]
+        df_copy.loc[df_copy[col] < 5, 'mole_fraction'] = df_copy[col]
+    df_copy['sum_original'] = df_copy[['V1', 'V2', 'V3', 'V4']].sum(axis=1, skipna=True)
+    df_copy['sum_new'] = df_copy[['pressure', 'temperature', 'mole_fraction', 'gamma']].sum(axis=1, skipna=True)
+    df_copy['sanity_check'] = (df_copy['sum_original'] - df_copy['sum_new']).abs() < 1e-6
+    df_copy = df_copy.sort_values(by='original_index').drop(columns=['original_index', 'sum_original', 'sum_new'])
+    df_copy = df_copy[df_copy['sanity_check']]
+    df_copy = df_copy.drop(columns=['sanity_check'])
+    df_copy = df_copy[df_copy['mole_fraction'] < 1e-5]
+    return df_copy
+
+
+def bench_decode(sizes=(10**5, 10**6, 10**7), reference_rows=10**4):
+    """Differential check against the reference decoder, then throughput of docode_data."""
+    df = make_raw_data(reference_rows)
+    expected, ref_seconds = timed(docode_data_reference, df)
+    result, _ = timed(docode_data, df, save=False)
+    assert result.index.equals(expected.index), "decoded rows differ from the reference implementation"
+    assert result.to_csv(index=False) == expected.to_csv(index=False), "decoded values differ from the reference implementation"
+    print(f"[step2] reference decoder: {reference_rows / ref_seconds:,.0f} rows/s at {reference_rows:,} rows (output identical)")
+
+    for n_rows in sizes:
+        df = make_raw_data(n_rows)
+        _, seconds = timed(docode_data, df, save=False)
+        print(f"[step2] vectorized decoder: {n_rows / seconds:,.0f} rows/s at {n_rows:,} rows")
+
+
+# -------------------- Step5: role assignment --------------------
+def make_component_rows(n_rows, n_ils=300, n_solutes=500, seed=0):
+    """Synthetic step5 input: component IDs, names and SMILES of both components in either order."""
+    rng = np.random.default_rng(seed)
+    il_smiles = np.array([f"C{'C' * (i % 12)}[n+]1ccn({'C' * (1 + i // 12)})c1.[B-](F)(F)(F)F" for i in range(n_ils)], dtype=object)
+    solute_smiles = np.array([f"{'C' * (1 + i % 20)}{'O' * (1 + i // 20)}" for i in range(n_solutes)], dtype=object)
+    solute_smiles[::50] = np.nan  # components without SMILES
+    il, solute = rng.integers(0, n_ils, n_rows), rng.integers(0, n_solutes, n_rows)
+    swap = rng.random(n_rows) < 0.5
+    df = pd.DataFrame({'id': rng.integers(0, max(1, n_rows // 20), n_rows).astype(str)})
+    for i, (first, second) in enumerate([(il, solute), (solute, il)], start=1):
+        is_il = swap if i == 2 else ~swap
+        df[f'cmp{i}_id'] = np.where(is_il, 'IL' + pd.Series(il).astype(str), 'S' + pd.Series(solute).astype(str))
+        df[f'cmp{i}_name'] = np.where(is_il, 'il name ' + pd.Series(il).astype(str), 'solute name ' + pd.Series(solute).astype(str))
+        df[f'cmp{i}_smiles'] = np.where(is_il, il_smiles[il], solute_smiles[solute])
+    df.loc[rng.random(n_rows) < 0.01, 'cmp1_smiles'] = np.nan  # entries without an identifiable IL
+    for column in ['cmp1_id', 'cmp2_id']:
+        df[column] = df[column].astype('category')
+    return df
+
+
+def is_ionic_liquid(smiles):
+    return isinstance(smiles, str) and ("." in smiles and "+" in smiles and "-")
+
+
+def assign_smiles_and_ids_reference(df):
+    """Previous row-by-row implementation of step5 assign_smiles_and_ids (IL detected from the raw string)."""
+    for index, row in df.iterrows():
+        smiles_1, smiles_2 = row['cmp1_smiles'], row['cmp2_smiles']
+        name_1, name_2 = row['cmp1_name'], row['cmp2_name']
+        id_1, id_2 = row['cmp1_id'], row['cmp2_id']
+        if is_ionic_liquid(smiles_1):
+            df.at[index, 'SMILES_IL'] = smiles_1
+            df.at[index, 'IL_name'] = name_1
+            df.at[index, 'IL_id'] = id_1
+            df.at[index, 'SMILES_solute'] = smiles_2
+            df.at[index, 'solute_name'] = name_2
+            df.at[index, 'solute_id'] = id_2
+        elif is_ionic_liquid(smiles_2):
+            df.at[index, 'SMILES_IL'] = smiles_2
+            df.at[index, 'IL_name'] = name_2
+            df.at[index, 'IL_id'] = id_2
+            df.at[index, 'SMILES_solute'] = smiles_1
+            df.at[index, 'solute_name'] = name_1
+            df.at[index, 'solute_id'] = id_1
+    return df
+
+
+def bench_place_smiles(sizes=(10**5, 10**6), reference_rows=2 * 10**4):
+    """Differential check against the row-by-row role assignment, then throughput of assign_smiles_and_ids."""
+    cache = MoleculeCache(os.path.join(tempfile.mkdtemp(), "molecule_cache.csv"))  # not saved
+    df = make_component_rows(reference_rows)
+    expected, ref_seconds = timed(assign_smiles_and_ids_reference, initialize_columns(df.copy()))
+    result, _ = timed(assign_smiles_and_ids, initialize_columns(df.copy()), cache)
+    assert result.dtypes.equals(expected.dtypes), "column types differ from the reference implementation"
+    assert result.to_csv(index=False) == expected.to_csv(index=False), "roles differ from the reference implementation"
+    print(f"[step5] reference role assignment: {reference_rows / ref_seconds:,.0f} rows/s at {reference_rows:,} rows (output identical)")
+
+    for n_rows in sizes:
+        df = initialize_columns(make_component_rows(n_rows))
+        _, seconds = timed(assign_smiles_and_ids, df, cache)
+        print(f"[step5] vectorized role assignment: {n_rows / seconds:,.0f} rows/s at {n_rows:,} rows "
+              f"({ref_seconds / reference_rows * n_rows / seconds:,.0f}x faster)")
+
+
+# -------------------- Steps 5/7: SMILES tokenizer --------------------
+def compound_smiles():
+    """Unique SMILES of the compound list shipped with ilthermopy (every compound ILThermo knows)."""
+    compounds = pd.read_csv(os.path.join(os.path.dirname(ilthermopy.__file__), 'data', 'compounds.csv'))
+    return list(compounds['smiles'].dropna().unique())
+
+
+def bench_tokenizer():
+    """
+    Differential check of the SMILES tokenizer against RDKit on the full compound list, then throughput.
+    Element sets and fragment counts must be identical. Charges may differ: RDKit charge-separates
+    chlorate and perchlorate ([O-]Cl(=O)(=O)=O -> [O-][Cl+3]([O-])([O-])[O-]), while the tokenizer
+    keeps the charges as written, as step5 counted them before the molecule cache.
+    """
+    smiles = compound_smiles()
+    mismatches = validate_tokenizer(smiles)
+    for column in ['elements', 'fragments']:
+        differs = mismatches['tokenizer'][column] != mismatches['rdkit'][column]
+        assert not differs.any(), f"{differs.sum()} SMILES have other {column} than RDKit:\n{mismatches[differs]}"
+    _, token_seconds = timed(describe_all, smiles, max_workers=1)
+    _, rdkit_seconds = timed(describe_all, smiles, max_workers=1, use_tokenizer=False)
+    print(f"[molecules] tokenizer: {len(smiles) / token_seconds:,.0f} SMILES/s on {len(smiles):,} compounds, "
+          f"RDKit: {len(smiles) / rdkit_seconds:,.0f} SMILES/s (element sets and fragments identical, "
+          f"{len(mismatches)} charge-separated by RDKit)")
+
+
+# -------------------- Steps 7/10: deduplication --------------------
+def make_activity_rows(n_rows, duplicate_rate=0.2, seed=0):
+    """Synthetic step7 rows where a fraction of (IL, solute, temperature, gamma, ref) keys repeats."""
+    rng = np.random.default_rng(seed)
+    n_unique = max(1, int(n_rows * (1 - duplicate_rate)))
+    keys = pd.DataFrame({
+        'IL_id': 'IL' + pd.Series(rng.integers(0, 500, n_unique)).astype(str),
+        'solute_id': 'S' + pd.Series(rng.integers(0, 2000, n_unique)).astype(str),
+        'temperature': rng.uniform(280, 420, n_unique).round(2),
+        'gamma': rng.lognormal(1.0, 1.0, n_unique).round(4),
+        'ref_id': rng.integers(1, 3000, n_unique),
+    })
+    df = keys.iloc[rng.integers(0, n_unique, n_rows)].reset_index(drop=True)
+    df.loc[rng.random(n_rows) < 0.01, 'solute_id'] = np.nan  # rows with a missing key are never removed
+    df.insert(0, 'original_index', range(n_rows))
+    return df
+
+
+def remove_duplicates_reference(df, keys):
+    """Previous implementation of step7 remove_redundant / step10 remove_duplicates."""
+    duplicates = df[df.duplicated(subset=keys, keep=False)]
+    duplicate_groups = duplicates.groupby(keys).apply(lambda x: x.index.tolist()).reset_index(name='duplicate_indices')
+    indices_to_remove = duplicate_groups['duplicate_indices'].apply(lambda x: x[1:]).sum()
+    return df.drop(indices_to_remove)
+
+
+def bench_dedup(sizes=(10**5, 10**6, 10**7), reference_rows=10**5):
+    """Differential check against the groupby/list-sum deduplication, then throughput of drop_duplicate_keys."""
+    keys = ['IL_id', 'solute_id', 'temperature', 'gamma', 'ref_id']
+    df = make_activity_rows(reference_rows)
+    expected, ref_seconds = timed(remove_duplicates_reference, df, keys)
+    (result, report), _ = timed(drop_duplicate_keys, df, keys)
+    assert result.equals(expected), "surviving rows differ from the reference implementation"
+    assert report['dropped_rows'].sum() == len(df) - len(expected)
+    print(f"[dedup] reference: {reference_rows / ref_seconds:,.0f} rows/s at {reference_rows:,} rows (output identical)")
+
+    for n_rows in sizes:
+        df = make_activity_rows(n_rows)
+        _, seconds = timed(drop_duplicate_keys, df, keys)
+        print(f"[dedup] hash kernel: {n_rows / seconds:,.0f} rows/s at {n_rows:,} rows")
+
+
+# -------------------- Step8: Gibbs-Helmholtz grouping --------------------
+def make_gh_rows(n_rows, n_combinations, seed=0):
+    """Synthetic step7 output: n_rows activity coefficients spread over n_combinations IL/solute pairs."""
+    rng = np.random.default_rng(seed)
+    combination = rng.zipf(1.3, n_rows) % n_combinations  # a few large and many small combinations
+    temperature = rng.uniform(280, 420, n_rows).round(2)
+    ln_gamma = 900 / temperature - 2 + (combination % 7) * 0.1 + rng.normal(0, 0.05, n_rows)
+    return pd.DataFrame({
+        'original_index': np.arange(n_rows),
+        'entry_id': 'E' + pd.Series(combination * 3 + rng.integers(0, 3, n_rows)).astype(str),
+        'ref_id': combination % 97 + rng.integers(0, 3, n_rows),
+        'IL_id': 'IL' + pd.Series(combination // 50).astype(str),
+        'solute_id': 'S' + pd.Series(combination % 50).astype(str),
+        'SMILES_IL': 'C[n+]1ccn(C)c1.[Cl-]',
+        'SMILES_solute': 'CCO',
+        'IL_name': 'il',
+        'solute_name': 'solute',
+        'temperature': temperature,
+        'gamma': np.exp(ln_gamma).round(4),
+    })
+
+
+def gibbs_helmholtz_reference(df, target='gamma', threshold=5):
+    """Previous mask-per-combination implementation of the step8 gh_df (without the saved splits)."""
+    combination_counts = df.groupby(['IL_id', 'solute_id']).size().reset_index(name='counts')
+    df = df.merge(combination_counts, on=['IL_id', 'solute_id'])
+    df = df[df['counts'] >= threshold].drop(columns=['counts'])
+    gh_df = df[['IL_id', 'solute_id']].drop_duplicates().copy()
+    subset = lambda row: df[(df['IL_id'] == row['IL_id']) & (df['solute_id'] == row['solute_id'])]
+    gh_df['population'] = gh_df.apply(lambda row: subset(row).shape[0], axis=1)
+    gh_df = gh_df.sort_values(by='population', ascending=False).reset_index(drop=True)
+    gh_df['unique_rank'] = range(1, len(gh_df) + 1)
+    for col in ['ref_id', 'original_index'] + df.columns.tolist():
+        if col not in gh_df.columns:
+            gh_df[col] = gh_df.apply(lambda row: subset(row)[col].tolist(), axis=1)
+
+    def calculate_regression_params(row):
+        rows = subset(row)
+        inv_temp, ln_target = 1 / rows['temperature'], np.log(rows[target])
+        slope, intercept, r_value, _, std_err = linregress(inv_temp, ln_target)
+        t_p_value = 1 if std_err == 0 else 2 * (1 - t.cdf(abs(slope / std_err), df=len(rows) - 2))
+        mean, std = ln_target.mean(), ln_target.std()
+        rsd = 0 if std == 0 else (std / ln_target.max()) * 100 if mean == 0 else (std / mean) * 100
+        mae = np.mean(np.abs(ln_target - (intercept + slope * inv_temp)))
+        normalized_mae = abs(mae / ln_target.max()) if mean == 0 else abs(mae / mean)
+        return pd.Series({'intercept': intercept, 'slope': slope, 'r_squared': r_value**2,
+                          't_p_value': t_p_value, 'rsd': rsd, 'normalized_mae': normalized_mae})
+
+    return pd.concat([gh_df, gh_df.apply(calculate_regression_params, axis=1)], axis=1)
+
+
+def bench_gibbs_helmholtz(sizes=((10**5, 10**3), (10**6, 10**4), (3 * 10**6, 3 * 10**4)), reference=(2 * 10**4, 300)):
+    """Differential check against the mask-per-combination step8, then throughput of gibbs_helmholtz_coefficients."""
+    df = make_gh_rows(*reference)
+    expected, ref_seconds = timed(gibbs_helmholtz_reference, df)
+    (result, *_), _ = timed(gibbs_helmholtz_coefficients, df, save=False)
+    assert result.columns.equals(expected.columns), "columns differ from the reference implementation"
+    fitted = ['intercept', 'slope', 'r_squared', 't_p_value', 'rsd', 'normalized_mae']
+    assert result.drop(columns=fitted).to_csv(index=False) == expected.drop(columns=fitted).to_csv(index=False), \
+        "combinations differ from the reference implementation"
+    assert np.allclose(result[fitted].to_numpy(float), expected[fitted].to_numpy(float), rtol=1e-9, atol=1e-12, equal_nan=True), \
+        "regression results differ from the reference implementation"
+    print(f"[step8] reference: {reference[0] / ref_seconds:,.0f} rows/s at {reference[0]:,} rows, "
+          f"{len(expected):,} combinations (output identical, regression to 1e-9)")
+
+    for n_rows, n_combinations in sizes:
+        df = make_gh_rows(n_rows, n_combinations)
+        (result, *_), seconds = timed(gibbs_helmholtz_coefficients, df, save=False)
+        print(f"[step8] single-pass grouping: {n_rows / seconds:,.0f} rows/s at {n_rows:,} rows, {len(result):,} combinations")
+
+
+def bench_gibbs_helmholtz_sweep(n_rows=10**6, n_combinations=10**4, targets=('gamma', 'temperature'), thresholds=(3, 5, 10, 20)):
+    """Parameter sweep of step8: one batch call against one gibbs_helmholtz_coefficients run per (target, threshold)."""
+    df = make_gh_rows(n_rows, n_combinations)
+    batch, batch_seconds = timed(gibbs_helmholtz_batch, df, targets, thresholds)
+    single_seconds = 0
+    for target in targets:
+        for threshold in thresholds:
+            result, seconds = timed(gibbs_helmholtz_coefficients, df, target, threshold=threshold, save=False)
+            single_seconds += seconds
+            assert all(a.equals(b) for a, b in zip(result, batch[(target, threshold)])), \
+                f"batch result for ({target}, {threshold}) differs from a single run"
+    print(f"[step8] sweep of {len(batch)} (target, threshold) pairs at {n_rows:,} rows: batch {batch_seconds:.2f} s, "
+          f"separate runs {single_seconds:.2f} s ({single_seconds / batch_seconds:.1f}x, results identical)")
+
+
+# -------------------- Step9: reference groups --------------------
+def make_conflict_rows(n_combinations, n_refs, points_per_ref=(1, 12), seed=0):
+    """Synthetic step8 combinations with n_refs references each (ref_ids interleaved as in merged entries)."""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for _ in range(n_combinations):
+        refs = rng.choice(10**6, n_refs, replace=False)
+        ref_ids = rng.permutation(np.repeat(refs, rng.integers(*points_per_ref, n_refs))).tolist()
+        n = len(ref_ids)
+        rows.append({'ref_id': ref_ids, 'original_index': rng.permutation(10 * n)[:n].tolist(),
+                     'temperature': rng.uniform(280, 420, n).round(2).tolist(), 'gamma': rng.lognormal(1, 1, n).round(4).tolist()})
+    return pd.DataFrame(rows)
+
+
+def process_row_reference(row):
+    """Previous step9 grouping: every distinct ref_id rescans all points of the combination."""
+    from collections import defaultdict
+    threshold = step9_conflict_handling.threshold
+    ref_ids, original_indices = list(row['ref_id']), list(row['original_index'])
+    temperatures, gammas = list(row['temperature']), list(row['gamma'])
+    ref_counts = {rid: ref_ids.count(rid) for rid in set(ref_ids)}
+    groups = defaultdict(lambda: {'ref_id': [], 'original_index': [], 'temperature': [], 'gamma': []})
+    groups['general_group'] = {'ref_id': ref_ids, 'original_index': original_indices, 'temperature': temperatures, 'gamma': gammas}
+    group_idx, has_sedu_group = 0, False
+    for rid, count in ref_counts.items():
+        group_name = f'group_{group_idx}' if count >= threshold else 'pseudo_group'
+        if count >= threshold:
+            group_idx += 1
+        else:
+            has_sedu_group = True
+        for i, rid_val in enumerate(ref_ids):
+            if rid_val == rid:
+                groups[group_name]['ref_id'].append(rid_val)
+                groups[group_name]['original_index'].append(original_indices[i])
+                groups[group_name]['temperature'].append(temperatures[i])
+                groups[group_name]['gamma'].append(gammas[i])
+    if has_sedu_group:
+        groups['pseudo_group'] = {'ref_id': [], 'original_index': [], 'temperature': [], 'gamma': []}
+        for rid, count in ref_counts.items():
+            if count < threshold:
+                for i, rid_val in enumerate(ref_ids):
+                    if rid_val == rid:
+                        groups['pseudo_group']['ref_id'].append(rid_val)
+                        groups['pseudo_group']['original_index'].append(original_indices[i])
+                        groups['pseudo_group']['temperature'].append(temperatures[i])
+                        groups['pseudo_group']['gamma'].append(gammas[i])
+    return groups
+
+
+def bench_ref_groups(n_combinations=50, refs=(10, 100, 300, 1000)):
+    """Differential check of the step9 reference grouping (membership, order and group names), then throughput."""
+    for n_refs in refs:
+        df = make_conflict_rows(n_combinations, n_refs)
+        n_points = sum(len(ref_ids) for ref_ids in df['ref_id'])
+        expected, ref_seconds = timed(lambda: [process_row_reference(row) for _, row in df.iterrows()])
+        result, seconds = timed(lambda: [process_row(row) for _, row in df.iterrows()])
+        assert all(list(a.items()) == list(b.items()) for a, b in zip(result, expected)), \
+            "groups differ from the reference implementation"
+        print(f"[step9] {n_refs} refs per combination: reference {n_points / ref_seconds:,.0f} points/s, "
+              f"argsort grouping {n_points / seconds:,.0f} points/s ({ref_seconds / seconds:.0f}x, groups identical)")
+
+
+if __name__ == "__main__":
+    bench_decode()
+    bench_place_smiles()
+    bench_tokenizer()
+    bench_dedup()
+    bench_gibbs_helmholtz()
+    bench_gibbs_helmholtz_sweep()
+    bench_ref_groups()
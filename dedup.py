@@ -0,0 +1,10 @@
+def drop_duplicate_keys(df, keys):
+    """
+    Keep the first row of every combination of the key columns in one hash-based pass.
+    Rows with a missing key value are always kept (they never formed a duplicate group).
+    Returns the deduplicated DataFrame and a report with the number of rows dropped per key.
+    """
+    complete = df[keys].notna().all(axis=1)
+    dropped = df.duplicated(subset=keys, keep='first') & complete
+    report = df.loc[dropped, keys].value_counts(sort=False, dropna=False).rename('dropped_rows').reset_index()
+    return df[~dropped], report
@@ -0,0 +1,214 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+CACHE_DIR = "Entry_Cache"
+CACHE_VERSION = 1          # bump when the on-disk layout changes; older records are treated as misses
+MAX_CACHE_SIZE_MB = 2048
+
+
+class EntryCache:
+    """
+    Content-addressed on-disk cache of raw ILThermo entry responses.
+
+    Each response is stored once under 'objects/' keyed by the SHA-256 of its JSON payload,
+    and 'manifest.jsonl' maps entry IDs to those hashes together with the cache version,
+    payload size and fetch timestamp. The manifest is append-only so several workers can
+    share the cache; it is compacted whenever entries are evicted. When the cache grows
+    beyond max_size_mb, the least recently used objects are removed first.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_size_mb=MAX_CACHE_SIZE_MB, max_age_days=None):
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, "objects")
+        self.manifest_path = os.path.join(cache_dir, "manifest.jsonl")
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.max_age = None if max_age_days is None else max_age_days * 86400
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._manifest = {}
+        self._hash_refs = {}  # object hash -> number of manifest entries referencing it
+        self._size = 0        # running size of all distinct objects referenced by the manifest
+        self._manifest_offset = 0
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._refresh_manifest()
+
+    # -------------------- Manifest --------------------
+    def _refresh_manifest(self):
+        """Replay manifest records appended since the last read (possibly by other workers)."""
+        if not os.path.exists(self.manifest_path):
+            return
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            f.seek(self._manifest_offset)
+            for line in f:
+                if not line.endswith("\n"):
+                    break  # partially written record, picked up on the next refresh
+                self._manifest_offset += len(line.encode("utf-8"))
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn write from a crashed run
+                if record.get("deleted"):
+                    self._drop_record(record["id"])
+                else:
+                    self._set_record(record["id"], record)
+
+    def _set_record(self, entry_id, record):
+        self._drop_record(entry_id)
+        self._manifest[entry_id] = record
+        refs = self._hash_refs.get(record["hash"], 0)
+        if not refs:
+            self._size += record["size"]
+        self._hash_refs[record["hash"]] = refs + 1
+
+    def _drop_record(self, entry_id):
+        """Remove entry_id from the in-memory manifest; returns the hash if no entry references it any more."""
+        record = self._manifest.pop(entry_id, None)
+        if record is None:
+            return None
+        refs = self._hash_refs[record["hash"]] - 1
+        if refs:
+            self._hash_refs[record["hash"]] = refs
+            return None
+        del self._hash_refs[record["hash"]]
+        self._size -= record["size"]
+        return record["hash"]
+
+    def _append_manifest(self, records):
+        with open(self.manifest_path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(record) + "\n" for record in records))
+
+    def _compact_manifest(self):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for record in self._manifest.values():
+                f.write(json.dumps(record) + "\n")
+        os.replace(tmp_path, self.manifest_path)
+        self._manifest_offset = os.path.getsize(self.manifest_path)
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest + ".json")
+
+    def _is_valid(self, record):
+        if record.get("version") != CACHE_VERSION:
+            return False
+        if self.max_age is not None and time.time() - record["fetched_at"] > self.max_age:
+            return False
+        return os.path.exists(self._object_path(record["hash"]))
+
+    # -------------------- Public API --------------------
+    def get(self, entry_id):
+        """Return the cached raw response for entry_id, or None on a miss."""
+        entry_id = str(entry_id)
+        with self._lock:
+            record = self._manifest.get(entry_id)
+            if record is None:
+                self._refresh_manifest()
+                record = self._manifest.get(entry_id)
+            if record is None or not self._is_valid(record):
+                self.misses += 1
+                return None
+            path = self._object_path(record["hash"])
+        try:
+            with open(path, "rb") as f:
+                payload = f.read()
+            os.utime(path)  # mark as recently used for eviction
+        except FileNotFoundError:
+            self.misses += 1
+            return None  # evicted by another worker in the meantime
+        self.hits += 1
+        return json.loads(payload)
+
+    def put(self, entry_id, response):
+        """Store a raw entry response and record it in the manifest (callers store only responses that parse)."""
+        entry_id = str(entry_id)
+        payload = json.dumps(response, sort_keys=True, separators=(",", ":")).encode("utf-8")
+        digest = hashlib.sha256(payload).hexdigest()
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, path)  # atomic, so readers never see half-written objects
+
+        record = {
+            "id": entry_id,
+            "hash": digest,
+            "size": len(payload),
+            "version": CACHE_VERSION,
+            "fetched_at": time.time(),
+        }
+        with self._lock:
+            self._append_manifest([record])
+            self._set_record(entry_id, record)
+            if self._size > self.max_size:
+                self._evict()
+
+    def discard(self, entry_id):
+        """Remove entry_id from the cache (e.g. a stored response that no longer parses)."""
+        entry_id = str(entry_id)
+        with self._lock:
+            if entry_id not in self._manifest:
+                return
+            self._append_manifest([{"id": entry_id, "deleted": True}])
+            digest = self._drop_record(entry_id)
+        if digest is not None:
+            try:
+                os.remove(self._object_path(digest))
+            except FileNotFoundError:
+                pass
+
+    def contains(self, entry_id):
+        entry_id = str(entry_id)
+        with self._lock:
+            record = self._manifest.get(entry_id)
+            if record is None:
+                self._refresh_manifest()
+                record = self._manifest.get(entry_id)
+            return record is not None and self._is_valid(record)
+
+    def missing(self, entry_ids):
+        """Return the subset of entry_ids that would require a network fetch."""
+        return [entry_id for entry_id in entry_ids if not self.contains(entry_id)]
+
+    def total_size(self):
+        """Size in bytes of all distinct objects referenced by the manifest."""
+        return self._size
+
+    def _evict(self):
+        """Delete least recently used objects until the cache fits into max_size."""
+        ids_by_hash = {}
+        for entry_id, record in self._manifest.items():
+            ids_by_hash.setdefault(record["hash"], []).append(entry_id)
+
+        def last_used(digest):
+            try:
+                return os.path.getmtime(self._object_path(digest))
+            except FileNotFoundError:
+                return 0.0
+
+        for digest in sorted(ids_by_hash, key=last_used):
+            if self._size <= self.max_size:
+                break
+            for entry_id in ids_by_hash[digest]:
+                self._drop_record(entry_id)
+            try:
+                os.remove(self._object_path(digest))
+            except FileNotFoundError:
+                pass
+        self._compact_manifest()
+
+
+_default_cache = None
+
+
+def default_cache():
+    """Return the process-wide EntryCache, creating it on first use."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = EntryCache()
+    return _default_cache
@@ -0,0 +1,137 @@
+import os
+import pandas as pd
+
+# Normalized entry metadata written by step1 next to the slim measurement table
+ENTRIES_FILE = os.path.join("Intermediate_Data", "step1_entries.csv")   # one row per entry ID
+REFS_FILE = os.path.join("Intermediate_Data", "step1_refs.csv")         # one row per interned ref_id
+
+ENTRY_COLUMNS = ['id', 'ref_id', 'phases', 'expmeth', 'solvent', 'property', 'property_type']
+
+
+def load_entries(file_path=ENTRIES_FILE):
+    """Load the entries table with integer ref IDs and all other columns as strings."""
+    return pd.read_csv(file_path, dtype={**{col: str for col in ENTRY_COLUMNS}, 'ref_id': 'Int64'})
+
+
+def load_refs(file_path=REFS_FILE):
+    """Load the reference table (ref_id -> stringified ref dict)."""
+    return pd.read_csv(file_path, dtype={'ref_id': 'Int64', 'ref': str})
+
+
+def attach_metadata(df, columns, entries=None):
+    """
+    Add entry-level metadata columns to a measurement table by looking them up through 'id'.
+    Columns that are already present are left untouched, and the row index is preserved.
+    Always returns a new DataFrame.
+    """
+    df = df.copy()
+    missing = [col for col in columns if col not in df.columns]
+    if not missing:
+        return df
+    if entries is None:
+        entries = load_entries()
+    entries = entries.set_index('id')
+    ids = df['id'].astype(str)
+    for col in missing:
+        df[col] = ids.map(entries[col])
+    return df
+
+
+def lookup_refs(ref_ids, refs=None):
+    """Return the stringified ref dicts for a sequence of ref IDs."""
+    if refs is None:
+        refs = load_refs()
+    return pd.Series(ref_ids).astype('Int64').map(refs.set_index('ref_id')['ref'])
+
+
+# -------------------- Components --------------------
+# Component details are kept once per ILThermo component ID in the registry; entries reference
+# their two components by ID (the sample description is specific to an entry and stays with it).
+COMPONENTS_FILE = os.path.join("Intermediate_Data", "step1_components.csv")    # entry ID -> component IDs
+REGISTRY_FILE = os.path.join("Intermediate_Data", "component_registry.csv")   # component ID -> details
+
+# Fields of one component record and the per-entry record layout returned by component_record
+COMPONENT_FIELDS = ['id', 'name', 'formula', 'smiles', 'smiles_error', 'sample', 'mw']
+COMPONENT_COLUMNS = ['id'] + [f"cmp{i}_{field}" for i in (1, 2) for field in COMPONENT_FIELDS]
+
+LINK_COLUMNS = ['id', 'cmp1_id', 'cmp1_sample', 'cmp2_id', 'cmp2_sample']
+REGISTRY_COLUMNS = ['cmp_id', 'name', 'formula', 'smiles', 'smiles_error', 'mw']
+KEY_COLUMNS = ['cmp1_id', 'cmp2_id']  # the component keys carried by measurement rows
+
+
+def component_record(entry_id, entry):
+    """Extract the details of the first two components of a fetched ILThermo entry."""
+    record = [entry_id]
+    for cmp in entry.components[:2]:
+        record += [cmp.id, cmp.name, cmp.formula, cmp.smiles, cmp.smiles_error, cmp.sample, cmp.mw]
+    return record + [None] * (len(COMPONENT_COLUMNS) - len(record))
+
+
+def load_links(entry_ids=None, file_path=COMPONENTS_FILE):
+    """
+    Load the entry -> component ID table, optionally restricted to entry_ids.
+    Returns an empty table when no components have been registered yet.
+    """
+    if not os.path.exists(file_path):
+        return pd.DataFrame(columns=LINK_COLUMNS)
+    links = pd.read_csv(file_path, dtype=str)
+    if entry_ids is not None:
+        links = links[links['id'].isin(pd.Series(entry_ids).astype(str))]
+    return links
+
+
+def load_registry(file_path=REGISTRY_FILE):
+    """Load the component registry (one row per ILThermo component ID)."""
+    if not os.path.exists(file_path):
+        return pd.DataFrame(columns=REGISTRY_COLUMNS)
+    return pd.read_csv(file_path, dtype={**{col: str for col in REGISTRY_COLUMNS}, 'mw': float})
+
+
+def register_components(records, append=True):
+    """
+    Adds per-entry component records (see component_record) to the link table and the registry.
+    Records without any component (failed fetches) are ignored. Links of already known entries
+    are replaced; registry rows of known components take the new details (e.g. a corrected name
+    or SMILES), and fields the new details lack keep their registered values.
+    Returns the number of components new to the registry.
+    """
+    records = pd.DataFrame(records, columns=COMPONENT_COLUMNS)
+    records = records[records[KEY_COLUMNS].notna().any(axis=1)]
+    if records.empty:
+        return 0
+    records = records.astype({'id': str})
+
+    links = records[LINK_COLUMNS]
+    details = pd.concat([
+        records[[f"cmp{i}_{field}" for field in COMPONENT_FIELDS if field != 'sample']].set_axis(REGISTRY_COLUMNS, axis=1)
+        for i in (1, 2)
+    ], ignore_index=True)
+    details = details[details['cmp_id'].notna()].groupby('cmp_id', sort=False).first().reset_index()
+
+    registry = load_registry() if append else pd.DataFrame(columns=REGISTRY_COLUMNS)
+    new_count = (~details['cmp_id'].isin(registry['cmp_id'])).sum()
+    if append and os.path.exists(COMPONENTS_FILE):
+        old_links = load_links()
+        links = pd.concat([old_links[~old_links['id'].isin(links['id'])], links], ignore_index=True)
+    registry = details.set_index('cmp_id').combine_first(registry.set_index('cmp_id'))
+    registry = registry.reset_index()[REGISTRY_COLUMNS]
+
+    links.to_csv(COMPONENTS_FILE, index=False)
+    registry.to_csv(REGISTRY_FILE, index=False)
+    return int(new_count)
+
+
+def attach_components(df, fields, registry=None):
+    """
+    Add cmp1_<field> and cmp2_<field> columns (e.g. 'smiles', 'name') to a table carrying the
+    cmp1_id/cmp2_id keys by looking them up in the registry. Always returns a new DataFrame.
+    """
+    df = df.copy()
+    if registry is None:
+        registry = load_registry()
+    registry = registry.set_index('cmp_id')
+    for i in (1, 2):
+        keys = df[f"cmp{i}_id"].astype(object)
+        for field in fields:
+            df[f"cmp{i}_{field}"] = keys.map(registry[field])
+    return df
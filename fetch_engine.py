@@ -0,0 +1,127 @@
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tqdm import tqdm
+from ilthermopy.requests import DATA_URL
+from ilthermopy.data_structs import ResponseToEntry
+from entry_cache import default_cache
+
+DEFAULT_MAX_IN_FLIGHT = 8
+DEFAULT_RATE_LIMIT = 10.0  # requests per second sent to the ILThermo server
+
+# Optional requests transport adapter mounted on every session instead of the pooled HTTPAdapter
+# (e.g. the record/replay adapters in ilthermo_replay)
+transport_adapter = None
+
+
+class TokenBucket:
+    """Thread-safe token bucket limiting how many requests are started per second."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def create_session(pool_size=DEFAULT_MAX_IN_FLIGHT):
+    """Create a requests.Session whose connection pool can hold pool_size keep-alive connections."""
+    session = requests.Session()
+    adapter = transport_adapter or HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def fetch_response(entry_id, session, timeout=10):
+    """Download the raw ILThermo response of one entry over the shared session."""
+    r = session.get(DATA_URL, params={"set": entry_id}, timeout=timeout)
+    r.raise_for_status()
+    return r.json()
+
+
+def fetch_entry(entry_id, session, bucket=None, cache=None, max_retries=3, timeout=10):
+    """
+    Return the ilthermopy Entry for entry_id, served from the entry cache when possible.
+    Network errors are retried with exponential backoff (1s, 2s, 4s, ...); None is returned
+    once all retries are exhausted. Only responses that parse are cached; a cached response
+    that no longer parses is evicted and fetched again.
+    """
+    cache = cache or default_cache()
+    response = cache.get(entry_id)
+    if response is not None:
+        try:
+            return ResponseToEntry(entry_id, response)
+        except Exception as e:
+            print(f"Cached response of entry {entry_id} could not be parsed ({e}). Fetching it again...")
+            cache.discard(entry_id)
+
+    for attempt in range(max_retries):
+        try:
+            if bucket is not None:
+                bucket.acquire()
+            response = fetch_response(entry_id, session, timeout=timeout)
+            entry = ResponseToEntry(entry_id, response)
+            cache.put(entry_id, response)
+            return entry
+
+        except requests.exceptions.Timeout:
+            print(f"Timeout error for entry {entry_id} (attempt {attempt+1}/{max_retries}). Retrying...")
+        except requests.exceptions.RequestException as e:
+            print(f"Request error for entry {entry_id} (attempt {attempt+1}/{max_retries}): {e}")
+        except Exception as e:
+            print(f"Unexpected error processing entry {entry_id} (attempt {attempt+1}/{max_retries}): {e}")
+
+        # Wait before retrying (exponential backoff)
+        if attempt < max_retries - 1:
+            time.sleep(2 ** attempt)
+
+    return None  # If all retries fail
+
+
+def fetch_entries(entry_ids, handler, max_in_flight=DEFAULT_MAX_IN_FLIGHT, rate_limit=DEFAULT_RATE_LIMIT,
+                  max_retries=3, timeout=10, cache=None, desc="Fetching ILThermo entries"):
+    """
+    Fetches ILThermo entries on a thread pool and yields (entry_id, result) as they complete.
+
+    All threads share one pooled HTTP session, at most max_in_flight requests are open at a
+    time and no more than rate_limit requests are started per second (None disables the limit).
+    handler(entry_id, entry) runs in the worker thread and its return value is yielded as result;
+    result is None when the entry could not be fetched or handler raised.
+    """
+    entry_ids = list(entry_ids)
+    cache = cache or default_cache()
+    bucket = TokenBucket(rate_limit) if rate_limit else None
+
+    def work(entry_id):
+        try:
+            entry = fetch_entry(entry_id, session, bucket=bucket, cache=cache, max_retries=max_retries, timeout=timeout)
+            if entry is None:
+                print(f"Error: Could not retrieve entry with ID {entry_id}")
+                return None
+            return handler(entry_id, entry)
+        except Exception as e:
+            print(f"Unexpected error processing entry {entry_id}: {e}")
+            return None
+
+    with create_session(max_in_flight) as session, ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        futures = {executor.submit(work, entry_id): entry_id for entry_id in entry_ids}
+        with tqdm(total=len(entry_ids), desc=desc, unit="entry") as pbar:
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+                pbar.update(1)
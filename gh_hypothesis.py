@@ -1,9 +1,9 @@
-import numpy as np
 import pandas as pd
 import os
+from intermediate_store import load_intermediate
 
-def load_data(file_path):
-    return pd.read_csv(file_path)
+def load_data(name):
+    return load_intermediate(name)
 
 def prepare_single_df(single_df):
     r_squared_single_df = single_df['r_squared'].dropna().tolist()
@@ -11,30 +11,9 @@ def prepare_single_df(single_df):
     return pd.DataFrame({'r_squared': r_squared_single_df, 'population': num_sample_single_df})
 
 def extract_r2_population(df):
-    r_squared_list = []
-    population_list = []
-    num_groups = len([col for col in df.columns if col.startswith("r2_group_")])
-    
-    for _, row in df.iterrows():
-        if pd.notna(row['selected_group']):
-            selected_group = int(row['selected_group'])
-            
-            if selected_group == num_groups - 1:
-                continue
-            
-            r2_col = f'r2_group_{selected_group}'
-            r_squared = row[r2_col] if pd.notna(row[r2_col]) else np.nan
-            
-            gamma_col = f'ln_gamma_group_{selected_group}'
-            if pd.notna(row[gamma_col]):
-                population = len(eval(row[gamma_col]))
-            else:
-                population = np.nan
-            
-            r_squared_list.append(r_squared)
-            population_list.append(population)
-    
-    return pd.DataFrame({'r_squared': r_squared_list, 'population': population_list})
+    # selected groups of the combinations, except the pseudo groups
+    selected = df[df['selected'] & (df['group'] != 'pseudo_group')]
+    return pd.DataFrame({'r_squared': selected['r2'].tolist(), 'population': selected['gamma'].map(len).tolist()})
 
 def save_results(df, name, directory="stat_analysis"):
     if not os.path.exists(directory):
@@ -42,9 +21,9 @@ def save_results(df, name, directory="stat_analysis"):
     df.to_csv(os.path.join(directory, f"r2_all_{name}.csv"), index=False)
 
 def gh_ftest():
-    single_df = load_data("Intermediate_Data/step8_single_ref_single_entry.csv")
-    multi_resolved_df = load_data("Intermediate_Data/step9_conflicted_data_resolved_multi.csv")
-    single_resolved_df = load_data("Intermediate_Data/step9_conflicted_data_resolved_single.csv")
+    single_df = load_data("step8_single_ref_single_entry")
+    multi_resolved_df = load_data("step9_conflicted_data_resolved_multi")
+    single_resolved_df = load_data("step9_conflicted_data_resolved_single")
 
     r2_single_df = prepare_single_df(single_df)
     r2_multi_resolved_df = extract_r2_population(multi_resolved_df)
@@ -89,21 +68,20 @@ def gh_ftest():
 
 
 
-def calculate_percentage(df, selected_group_col, false_count_group_col):
+def calculate_percentage(df):
     """Calculate the percentage of entries that passed the Chow test."""
-    not_none_count = df[selected_group_col].notna().sum()
-    total_count = len(df[false_count_group_col])
-    percentage_passed = (not_none_count / total_count) * 100
+    passed = df.groupby('combination')['selected'].any()
+    percentage_passed = (passed.sum() / len(passed)) * 100
     return percentage_passed
 
 def chow_pass():
     # Load dataframes
-    multi_resolved_df = load_data("Intermediate_Data/step9_conflicted_data_resolved_multi.csv")
-    single_resolved_df = load_data("Intermediate_Data/step9_conflicted_data_resolved_single.csv")
+    multi_resolved_df = load_data("step9_conflicted_data_resolved_multi")
+    single_resolved_df = load_data("step9_conflicted_data_resolved_single")
 
     # Calculate percentages
-    multi_ref_percentage = calculate_percentage(multi_resolved_df, 'selected_group', 'False_count_group_0')
-    single_ref_percentage = calculate_percentage(single_resolved_df, 'selected_group', 'False_count_group_0')
+    multi_ref_percentage = calculate_percentage(multi_resolved_df)
+    single_ref_percentage = calculate_percentage(single_resolved_df)
 
     # Prepare results
     results = (
@@ -2,8 +2,9 @@ import os
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.stats import linregress
 from tqdm import tqdm  
+from gh_regression import ragged, gibbs_helmholtz_regression
+from intermediate_store import load_intermediate
 
 def visualize_all_ranks(ranked_combinations, name, target = 'gamma', batch_size=100, specific_ranks=None):
     """
@@ -31,6 +32,11 @@ def visualize_all_ranks(ranked_combinations, name, target = 'gamma', batch_size=
     # Get the total number of ranks
     total_ranks = len(ranked_combinations)
 
+    # Fit all ranks at once
+    temperatures, offsets = ragged(ranked_combinations['temperature'].tolist())
+    targets, _ = ragged(ranked_combinations[target].tolist())
+    regression = gibbs_helmholtz_regression(temperatures, targets, offsets)
+
     print(f"Processing {total_ranks} ranks...")
 
     # Process ranks in batches
@@ -38,23 +44,21 @@ def visualize_all_ranks(ranked_combinations, name, target = 'gamma', batch_size=
         end_idx = min(start_idx + batch_size, total_ranks)
         batch = ranked_combinations.iloc[start_idx:end_idx]
 
-        for _, row in batch.iterrows():
+        for (_, row), (_, fit) in zip(batch.iterrows(), regression.iloc[start_idx:end_idx].iterrows()):
             try:
                 # Extract data for the current rank
                 il_id = row['IL_id']
                 sol_id = row['solute_id']
                 subset_data = pd.DataFrame({
-                    'temperature': eval(row['temperature']),
-                    target: eval(row[target])
+                    'temperature': row['temperature'],
+                    target: row[target]
                 })
 
                 # Calculate 1/temperature and ln(target)
                 subset_data['temperature'] = 1 / subset_data['temperature']
                 subset_data['ln_gamma'] = np.log(subset_data[target])
 
-                # Perform linear regression
-                slope, intercept, r_value, _, _ = linregress(subset_data['temperature'], subset_data['ln_gamma'])
-                r_squared = r_value**2
+                slope, intercept, r_squared = fit['slope'], fit['intercept'], fit['r_squared']
 
                 # Plot the data
                 plt.figure(figsize=(10, 6))
@@ -78,8 +82,7 @@ def visualize_all_ranks(ranked_combinations, name, target = 'gamma', batch_size=
 
 if __name__ == "__main__":
     
-    file_path = 'Intermediate_Data/step8_gh_multiple_ref_combinations.csv'
     output_folder = 'multi_ref_plots'
-    ranked_combinations = pd.read_csv(file_path)
+    ranked_combinations = load_intermediate('step8_gh_multiple_ref_combinations')
 
     visualize_all_ranks(ranked_combinations, output_folder)
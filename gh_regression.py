@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+from itertools import chain
+from scipy.stats import t
+
+# Batched Gibbs-Helmholtz regression: ln(target) = intercept + slope / T fitted for every group of a
+# ragged dataset in one vectorized pass. Groups are given as flat value arrays plus offsets
+# (group i holds the values offsets[i]:offsets[i + 1]) and all per-group sums are segment sums.
+# The statistics match scipy.stats.linregress and the per-combination formulas of step8.
+
+
+def ragged(lists):
+    """Flatten a sequence of lists into a float array and the offsets of the groups."""
+    lengths = np.fromiter((len(values) for values in lists), dtype=np.int64, count=len(lists))
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+    return np.fromiter(chain.from_iterable(lists), dtype=float, count=offsets[-1]), offsets
+
+
+def segment_sum(values, segments, n_groups):
+    return np.bincount(segments, weights=values, minlength=n_groups)
+
+
+def segment_max(values, offsets):
+    result = np.full(len(offsets) - 1, np.nan)
+    nonempty = np.diff(offsets) > 0
+    if nonempty.any():
+        result[nonempty] = np.maximum.reduceat(values, offsets[:-1][nonempty])
+    return result
+
+
+def linear_regression(x, y, offsets):
+    """
+    Least-squares fit y = intercept + slope * x for every group. Returns a DataFrame with one row
+    per group: n, slope, intercept, r_squared, std_err (of the slope), t_p_value (two-sided t-test
+    of the slope), rsd (relative standard deviation of y in %) and normalized_mae (mean absolute
+    residual relative to the mean of y). Groups with identical x values get NaN coefficients.
+    """
+    x, y, offsets = np.asarray(x, dtype=float), np.asarray(y, dtype=float), np.asarray(offsets, dtype=np.int64)
+    n_groups = len(offsets) - 1
+    n = np.diff(offsets).astype(float)
+    segments = np.repeat(np.arange(n_groups), np.diff(offsets))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_mean = segment_sum(x, segments, n_groups) / n
+        y_mean = segment_sum(y, segments, n_groups) / n
+        dx, dy = x - x_mean[segments], y - y_mean[segments]
+        ssxm = segment_sum(dx * dx, segments, n_groups) / n
+        ssym = segment_sum(dy * dy, segments, n_groups) / n
+        ssxym = segment_sum(dx * dy, segments, n_groups) / n
+
+        # Correlation and coefficients as in scipy.stats.linregress
+        r_den = np.sqrt(ssxm * ssym)
+        r = np.clip(np.where(r_den == 0, 0.0, ssxym / r_den), -1.0, 1.0)
+        slope = np.where(ssxm == 0, np.nan, ssxym / ssxm)
+        intercept = y_mean - slope * x_mean
+        dof = n - 2
+        std_err = np.where(n == 2, 0.0, np.sqrt((1 - r**2) * ssym / ssxm / dof))
+
+        # t-test of the slope (a zero standard error means no relationship can be tested)
+        t_stat = np.abs(slope / std_err)
+        t_p_value = np.where(std_err == 0, 1.0, 2 * (1 - t.cdf(t_stat, dof)))
+
+        # Relative standard deviation of y and normalized mean absolute error of the fit
+        y_std = np.sqrt(segment_sum(dy * dy, segments, n_groups) / (n - 1))
+        y_max = segment_max(y, offsets)
+        scale = np.where(y_mean == 0, y_max, y_mean)
+        rsd = np.where(y_std == 0, 0.0, y_std / scale * 100)
+        mae = segment_sum(np.abs(y - (intercept[segments] + slope[segments] * x)), segments, n_groups) / n
+        normalized_mae = np.abs(mae / scale)
+
+    return pd.DataFrame({'n': np.diff(offsets), 'slope': slope, 'intercept': intercept, 'r_squared': r**2,
+                         'std_err': std_err, 't_p_value': t_p_value, 'rsd': rsd, 'normalized_mae': normalized_mae})
+
+
+def gibbs_helmholtz_regression(temperatures, targets, offsets):
+    """Fit ln(target) against 1/temperature for every group of the flat temperature/target arrays."""
+    with np.errstate(divide='ignore'):
+        return linear_regression(1 / np.asarray(temperatures, dtype=float), np.log(np.asarray(targets, dtype=float)), offsets)
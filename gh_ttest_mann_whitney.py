@@ -1,9 +1,10 @@
 import numpy as np
 import pandas as pd
 import scipy.stats as stats
+from intermediate_store import load_intermediate
 
-def load_data(file_path):
-    return pd.read_csv(file_path)
+def load_data(name):
+    return load_intermediate(name, columns=['r_squared'])
 
 def extract_r_squared(dataframe):
     return dataframe['r_squared']
@@ -23,9 +24,9 @@ def write_results(file, test_name, result, group1_name, group2_name):
 
 def ttest_mann_whitney():
     # Step 1: Load the CSV files
-    single_ref_single_entry = load_data("Intermediate_Data/step8_single_ref_single_entry.csv")
-    single_ref_multi_entry = load_data("Intermediate_Data/step8_single_ref_multiple_entry.csv")
-    multi_ref = load_data("Intermediate_Data/step8_gh_multiple_ref_combinations.csv")
+    single_ref_single_entry = load_data("step8_single_ref_single_entry")
+    single_ref_multi_entry = load_data("step8_single_ref_multiple_entry")
+    multi_ref = load_data("step8_gh_multiple_ref_combinations")
 
     # Step 2: Extract the r_squared columns
     r_squared_single_ref_single_entry = extract_r_squared(single_ref_single_entry)
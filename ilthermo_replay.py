@@ -0,0 +1,254 @@
+import os
+import json
+import time
+import random
+import hashlib
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit, parse_qsl
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+import ilthermopy.requests as ilt_requests
+import fetch_engine
+import entry_cache
+from entry_cache import EntryCache
+
+FIXTURE_DIR = "ILThermo_Fixtures"
+
+
+# -------------------- Fixture Store --------------------
+def request_key(url):
+    """Key a GET request by its path and sorted query parameters (host and '//' are ignored)."""
+    parts = urlsplit(url)
+    path = "/" + "/".join(p for p in parts.path.split("/") if p)
+    params = sorted(parse_qsl(parts.query, keep_blank_values=True))
+    return hashlib.sha256(json.dumps([path, params]).encode("utf-8")).hexdigest()
+
+
+def fixture_path(fixture_dir, url):
+    return os.path.join(fixture_dir, request_key(url) + ".json")
+
+
+def build_response(request, status_code, body):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = body.encode("utf-8")
+    response.encoding = "utf-8"
+    response.headers["Content-Type"] = "application/json"
+    response.url = request.url
+    response.request = request
+    return response
+
+
+class RecordingAdapter(HTTPAdapter):
+    """HTTPAdapter that forwards requests to ILThermo and saves every successful response as a fixture."""
+
+    def __init__(self, fixture_dir=FIXTURE_DIR, **kwargs):
+        super().__init__(**kwargs)
+        self.fixture_dir = fixture_dir
+        os.makedirs(fixture_dir, exist_ok=True)
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        if response.status_code == 200:
+            path = fixture_path(self.fixture_dir, request.url)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"url": request.url, "status": response.status_code, "body": response.text}, f)
+            os.replace(tmp_path, path)
+        return response
+
+
+class ReplayAdapter(BaseAdapter):
+    """
+    Transport adapter that serves recorded fixtures instead of contacting ILThermo.
+
+    Every request waits latency seconds (plus up to jitter seconds). A fraction error_rate of
+    requests fails with HTTP 503 and a fraction timeout_rate hangs for the request timeout
+    (at most max_timeout_delay seconds) and raises ReadTimeout. Unknown requests return 404.
+    """
+
+    def __init__(self, fixture_dir=FIXTURE_DIR, latency=0.0, jitter=0.0, error_rate=0.0, timeout_rate=0.0,
+                 max_timeout_delay=1.0, seed=None):
+        super().__init__()
+        self.fixture_dir = fixture_dir
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.max_timeout_delay = max_timeout_delay
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        with self._lock:
+            self.requests += 1
+            draw = self._random.random()
+            delay = self.latency + self._random.random() * self.jitter
+
+        if draw < self.timeout_rate:
+            read_timeout = timeout[1] if isinstance(timeout, tuple) else timeout
+            time.sleep(min(read_timeout or self.max_timeout_delay, self.max_timeout_delay))
+            raise requests.exceptions.ReadTimeout(f"Simulated timeout for {request.url}", request=request)
+        time.sleep(delay)
+        if draw < self.timeout_rate + self.error_rate:
+            return build_response(request, 503, json.dumps({"errors": ["Simulated server error"]}))
+
+        path = fixture_path(self.fixture_dir, request.url)
+        if not os.path.exists(path):
+            return build_response(request, 404, json.dumps({"errors": [f"No fixture recorded for {request.url}"]}))
+        with open(path, "r", encoding="utf-8") as f:
+            fixture = json.load(f)
+        return build_response(request, fixture["status"], fixture["body"])
+
+    def close(self):
+        pass
+
+
+# -------------------- Installation --------------------
+class _RequestsShim:
+    """Stands in for the 'requests' module inside ilthermopy.requests so Search/GetEntry use our session."""
+
+    def __init__(self, session):
+        self.session = session
+
+    def get(self, url, params=None, **kwargs):
+        return self.session.get(url, params=params, **kwargs)
+
+
+@contextmanager
+def use_adapter(adapter):
+    """
+    Route all ILThermo traffic of the pipeline (ilthermopy search/entry calls and the
+    fetch engine) through adapter for the duration of the with-block.
+    """
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    previous_requests, previous_adapter = ilt_requests._requests, fetch_engine.transport_adapter
+    ilt_requests._requests = _RequestsShim(session)
+    fetch_engine.transport_adapter = adapter
+    try:
+        yield adapter
+    finally:
+        ilt_requests._requests = previous_requests
+        fetch_engine.transport_adapter = previous_adapter
+
+
+@contextmanager
+def recording(fixture_dir=FIXTURE_DIR):
+    """
+    Record mode: talk to the live server and capture search and entry responses as fixtures.
+    The entry cache is bypassed (an empty temporary cache stands in for the default one), so
+    entries cached by earlier runs are requested and recorded too.
+    """
+    cache_dir = tempfile.mkdtemp(prefix="entry_cache_recording_")
+    previous_cache = entry_cache._default_cache
+    entry_cache._default_cache = EntryCache(cache_dir)
+    try:
+        with use_adapter(RecordingAdapter(fixture_dir, pool_maxsize=fetch_engine.DEFAULT_MAX_IN_FLIGHT)) as adapter:
+            yield adapter
+    finally:
+        entry_cache._default_cache = previous_cache
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def replaying(fixture_dir=FIXTURE_DIR, **options):
+    """Replay mode: serve captured fixtures offline (see ReplayAdapter for latency/error options)."""
+    return use_adapter(ReplayAdapter(fixture_dir, **options))
+
+
+# -------------------- Benchmark --------------------
+def recorded_entry_ids(fixture_dir=FIXTURE_DIR):
+    """Return the entry IDs for which an entry response was recorded."""
+    entry_ids = []
+    data_path = "/" + "/".join(p for p in urlsplit(ilt_requests.DATA_URL).path.split("/") if p)
+    for name in sorted(os.listdir(fixture_dir)):
+        if not name.endswith(".json"):
+            continue
+        with open(os.path.join(fixture_dir, name), "r", encoding="utf-8") as f:
+            parts = urlsplit(json.load(f)["url"])
+        if "/" + "/".join(p for p in parts.path.split("/") if p) == data_path:
+            entry_ids.append(dict(parse_qsl(parts.query))["set"])
+    return entry_ids
+
+
+def benchmark_fetch(entry_ids, handler=None, concurrency_levels=(1, 4, 8, 16), rate_limit=None,
+                    fixture_dir=FIXTURE_DIR, **options):
+    """
+    Replays the fetch of entry_ids at several concurrency levels, each time with an empty
+    entry cache, followed by one fully cached pass. Returns a list of result dicts.
+    """
+    handler = handler or (lambda entry_id, entry: entry_id)
+    results = []
+    cache_dir = tempfile.mkdtemp(prefix="entry_cache_bench_")
+    try:
+        for max_in_flight in concurrency_levels:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            cache = EntryCache(cache_dir)
+            with replaying(fixture_dir, **options) as adapter:
+                start = time.perf_counter()
+                fetched = [r for _, r in _replay_fetch(entry_ids, handler, max_in_flight, rate_limit, cache)]
+                elapsed = time.perf_counter() - start
+            results.append({'max_in_flight': max_in_flight, 'cached': False, 'seconds': elapsed,
+                            'entries_per_second': len(entry_ids) / elapsed if elapsed else float('inf'),
+                            'failed': sum(r is None for r in fetched), 'requests': adapter.requests})
+
+        with replaying(fixture_dir, **options) as adapter:
+            start = time.perf_counter()
+            fetched = [r for _, r in _replay_fetch(entry_ids, handler, concurrency_levels[-1], rate_limit, cache)]
+            elapsed = time.perf_counter() - start
+        results.append({'max_in_flight': concurrency_levels[-1], 'cached': True, 'seconds': elapsed,
+                        'entries_per_second': len(entry_ids) / elapsed if elapsed else float('inf'),
+                        'failed': sum(r is None for r in fetched), 'requests': adapter.requests})
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    return results
+
+
+def _replay_fetch(entry_ids, handler, max_in_flight, rate_limit, cache):
+    return fetch_engine.fetch_entries(entry_ids, handler, max_in_flight=max_in_flight, rate_limit=rate_limit,
+                                      cache=cache, desc=f"Replaying ({max_in_flight} in flight)")
+
+
+def check_malformed_entry(entry_id="0", body='{"errors": ["Simulated malformed entry"]}', fixture_dir=None):
+    """
+    Regression check: replay an entry whose 200 response does not parse twice, the second time
+    with the raw response already in the cache (as left by older runs). Both passes must report
+    the entry as failed without aborting the harvest and must leave nothing in the cache.
+    """
+    fixture_dir = fixture_dir or tempfile.mkdtemp(prefix="ilthermo_fixtures_")
+    cache_dir = tempfile.mkdtemp(prefix="entry_cache_check_")
+    try:
+        url = requests.Request("GET", ilt_requests.DATA_URL, params={"set": entry_id}).prepare().url
+        os.makedirs(fixture_dir, exist_ok=True)
+        with open(fixture_path(fixture_dir, url), "w", encoding="utf-8") as f:
+            json.dump({"url": url, "status": 200, "body": body}, f)
+
+        cache = EntryCache(cache_dir)
+        for replay in range(2):
+            if replay:
+                cache.put(entry_id, json.loads(body))
+            with replaying(fixture_dir):
+                results = dict(fetch_engine.fetch_entries([entry_id], lambda entry_id, entry: entry_id, max_retries=1,
+                                                          rate_limit=None, cache=cache, desc="Replaying malformed entry"))
+            assert results == {entry_id: None}, f"malformed entry {entry_id} was not reported as failed: {results}"
+            assert not cache.contains(entry_id), f"malformed entry {entry_id} is still cached"
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    print(f"Malformed entry check passed: entry {entry_id} failed on both replays and was not cached.")
+
+
+if __name__ == "__main__":
+    # 1) Record once against the live server, e.g.:
+    #    with recording():
+    #        get_and_combine_data({"prop_key": "BPpY", "n_compounds": 2})
+    # 2) Benchmark offline against the recorded fixtures:
+    check_malformed_entry()
+    entry_ids = recorded_entry_ids()
+    print(f"{len(entry_ids)} recorded entries found in {FIXTURE_DIR}")
+    for result in benchmark_fetch(entry_ids, latency=0.2, jitter=0.1, error_rate=0.02, timeout_rate=0.01):
+        print(result)
@@ -0,0 +1,225 @@
+import os
+import sys
+import json
+import fnmatch
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_PARQUET = True
+except ImportError:  # fall back to CSV hand-offs when pyarrow is not installed
+    HAS_PARQUET = False
+
+INTERMEDIATE_DIR = "Intermediate_Data"
+COMPRESSION = "zstd"
+EXPORT_CSV = False  # also write a human-readable CSV next to every Parquet intermediate
+
+# -------------------- Schemas --------------------
+# Column types of the step hand-offs. Intermediate names and column keys may be fnmatch patterns;
+# the first matching key wins. 'str' keeps missing values as NaN and converts everything else to
+# Python strings. 'list' columns hold one Python list per row (e.g. all temperatures of a
+# combination); Parquet stores them as native nested lists, the CSV fallback as JSON arrays.
+RAW_SCHEMA = {'id': 'str', 'V*': 'float64', 'dV*': 'float64'}
+DECODED_SCHEMA = {**RAW_SCHEMA, 'solvent': 'category', 'property': 'category', 'property_type': 'category',
+                  'temperature': 'float64', 'pressure': 'float64', 'mole_fraction': 'float64', 'gamma': 'float64'}
+COMPONENTS_SCHEMA = {**DECODED_SCHEMA, 'cmp?_id': 'category'}  # component keys into the component registry
+ROLES_SCHEMA = {**COMPONENTS_SCHEMA, 'SMILES_IL': 'str', 'SMILES_solute': 'str', 'IL_name': 'str',
+                'solute_name': 'str', 'IL_id': 'str', 'solute_id': 'str', 'ref_id': 'Int64'}
+FILTERED_SCHEMA = {'original_index': 'int64', 'entry_id': 'str', 'ref_id': 'int64', 'IL_id': 'str', 'solute_id': 'str',
+                   'SMILES_IL': 'str', 'SMILES_solute': 'str', 'IL_name': 'str', 'solute_name': 'str',
+                   'temperature': 'float64', 'gamma': 'float64'}
+GH_SCHEMA = {'IL_id': 'str', 'solute_id': 'str', 'population': 'int64', 'unique_rank': 'int64',
+             'intercept': 'float64', 'slope': 'float64', 'r_squared': 'float64', 't_p_value': 'float64',
+             'rsd': 'float64', 'normalized_mae': 'float64', '*': 'list'}
+# step9 tables are long: one row per (combination, group) or per (combination, group pair)
+GROUPS_SCHEMA = {'combination': 'int64', 'IL_id': 'str', 'solute_id': 'str', 'group': 'str', 'group_1': 'str', 'group_2': 'str',
+                 'slope': 'float64', 'intercept': 'float64', 'r2': 'float64', 'F_stat': 'float64', 'p_value': 'float64',
+                 'significant': 'float64', 'False_count': 'int64', 'selected': 'bool', '*': 'list'}
+
+SCHEMAS = {
+    'step1_raw_activity_data': RAW_SCHEMA,
+    'step2_columns_adjusted': DECODED_SCHEMA,
+    'step3_smiles_added': COMPONENTS_SCHEMA,
+    'step4_missing_smiles_added': COMPONENTS_SCHEMA,
+    'step5_place_smiles_for_IL_and_solute': ROLES_SCHEMA,
+    'step6_activity_data_removed_duplicate_refs': ROLES_SCHEMA,
+    'step7_activity_data_elements_filtered': FILTERED_SCHEMA,
+    'step8_*': GH_SCHEMA,
+    'step9_*': GROUPS_SCHEMA,
+}
+
+
+def schema_for(name):
+    if name in SCHEMAS:
+        return SCHEMAS[name]
+    for pattern, schema in SCHEMAS.items():
+        if fnmatch.fnmatchcase(name, pattern):
+            return schema
+    return {}
+
+
+def column_type(name, column):
+    for pattern, dtype in schema_for(name).items():
+        if fnmatch.fnmatchcase(column, pattern):
+            return dtype
+    return None
+
+
+def apply_schema(df, name):
+    """Coerce the columns of df to the types declared for the intermediate `name`."""
+    df = df.copy()
+    for column in df.columns:
+        dtype = column_type(name, column)
+        if dtype is None or str(df[column].dtype) == dtype:
+            continue
+        if dtype == 'list':
+            df[column] = df[column].map(lambda v: json.loads(v) if isinstance(v, str) else v)  # CSV fallback only
+        elif dtype == 'str':
+            values = df[column]
+            df[column] = values.where(values.isna(), values.astype(str)).astype(object)
+        elif dtype == 'category':
+            df[column] = df[column].astype('category')
+        else:
+            df[column] = pd.to_numeric(df[column], errors='coerce').astype(dtype)
+    return df
+
+
+def csv_frame(df, name):
+    """Return df with its 'list' columns encoded as JSON arrays for a CSV file."""
+    list_columns = [col for col in df.columns if column_type(name, col) == 'list']
+    if not list_columns:
+        return df
+    df = df.copy()
+    for column in list_columns:
+        df[column] = df[column].map(lambda v: json.dumps(v) if isinstance(v, list) else v)
+    return df
+
+
+def table_to_frame(table):
+    """Convert an Arrow table to a DataFrame with nested list columns as Python lists (not arrays)."""
+    list_columns = [field.name for field in table.schema if pa.types.is_list(field.type) or pa.types.is_large_list(field.type)]
+    df = table.drop_columns(list_columns).to_pandas()
+    for column in list_columns:
+        df[column] = pd.Series(table.column(column).to_pylist(), index=df.index, dtype=object)
+    return df[table.column_names]
+
+
+# -------------------- Paths --------------------
+def intermediate_path(name, fmt=None, directory=INTERMEDIATE_DIR):
+    fmt = fmt or ('parquet' if HAS_PARQUET else 'csv')
+    return os.path.join(directory, f"{name}.{fmt}")
+
+
+def stored_path(name, directory=INTERMEDIATE_DIR):
+    """Return the path load_intermediate reads `name` from, or None if it is not stored."""
+    for fmt in (('parquet', 'csv') if HAS_PARQUET else ('csv',)):
+        path = intermediate_path(name, fmt, directory)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def intermediate_exists(name, directory=INTERMEDIATE_DIR):
+    return any(os.path.exists(intermediate_path(name, fmt, directory)) for fmt in ('parquet', 'csv'))
+
+
+# -------------------- Save / Load --------------------
+def save_intermediate(df, name, export_csv=None, directory=INTERMEDIATE_DIR):
+    """
+    Save a step hand-off as compressed Parquet with the declared schema (CSV when pyarrow is
+    unavailable). With export_csv=True (or EXPORT_CSV) a CSV copy is written for humans.
+    Returns the path of the primary file.
+    """
+    os.makedirs(directory, exist_ok=True)
+    df = apply_schema(df, name)
+    path = intermediate_path(name, directory=directory)
+    if HAS_PARQUET:
+        df.to_parquet(path, index=False, compression=COMPRESSION)
+    if not HAS_PARQUET or (EXPORT_CSV if export_csv is None else export_csv):
+        csv_frame(df, name).to_csv(intermediate_path(name, 'csv', directory), index=False)
+    return path
+
+
+def load_intermediate(name, columns=None, directory=INTERMEDIATE_DIR):
+    """
+    Load a step hand-off, reading only `columns` when given. Parquet is preferred; a CSV
+    intermediate (older runs, or no pyarrow) is parsed and coerced to the declared schema.
+    """
+    parquet_path = intermediate_path(name, 'parquet', directory)
+    if HAS_PARQUET and os.path.exists(parquet_path):
+        return table_to_frame(pq.read_table(parquet_path, columns=columns))
+    df = pd.read_csv(intermediate_path(name, 'csv', directory), usecols=columns, low_memory=False, float_precision='round_trip')
+    return apply_schema(df, name)
+
+
+def intermediate_columns(name, directory=INTERMEDIATE_DIR):
+    """Return the column names of a stored intermediate without reading its data."""
+    parquet_path = intermediate_path(name, 'parquet', directory)
+    if HAS_PARQUET and os.path.exists(parquet_path):
+        return pq.read_schema(parquet_path).names
+    return pd.read_csv(intermediate_path(name, 'csv', directory), nrows=0).columns.tolist()
+
+
+def iter_intermediate(name, batch_size=100_000, directory=INTERMEDIATE_DIR):
+    """Yield a step hand-off in DataFrame batches without loading it as a whole."""
+    parquet_path = intermediate_path(name, 'parquet', directory)
+    if HAS_PARQUET and os.path.exists(parquet_path):
+        for batch in pq.ParquetFile(parquet_path).iter_batches(batch_size=batch_size):
+            yield table_to_frame(pa.Table.from_batches([batch]))
+    else:
+        for chunk in pd.read_csv(intermediate_path(name, 'csv', directory), chunksize=batch_size, low_memory=False, float_precision='round_trip'):
+            yield apply_schema(chunk, name)
+
+
+class IntermediateWriter:
+    """
+    Streams DataFrame batches with identical columns into one intermediate file.
+    The file is written under a temporary name and moved into place on close.
+    """
+
+    def __init__(self, name, directory=INTERMEDIATE_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.name = name
+        self.path = intermediate_path(name, directory=directory)
+        self.tmp_path = self.path + ".tmp"
+        self._writer = None
+        self._schema = None
+        self._header = True
+
+    def write(self, df):
+        df = apply_schema(df, self.name)
+        if HAS_PARQUET:
+            if self._writer is None:
+                self._schema = pa.Schema.from_pandas(df, preserve_index=False)
+                self._writer = pq.ParquetWriter(self.tmp_path, self._schema, compression=COMPRESSION)
+            self._writer.write_table(pa.Table.from_pandas(df, schema=self._schema, preserve_index=False))
+        else:
+            csv_frame(df, self.name).to_csv(self.tmp_path, mode='w' if self._header else 'a', header=self._header, index=False)
+        self._header = False
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if os.path.exists(self.tmp_path):
+            os.replace(self.tmp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            if self._writer is not None:
+                self._writer.close()
+            if os.path.exists(self.tmp_path):
+                os.remove(self.tmp_path)
+
+
+if __name__ == "__main__":
+    # Export all Parquet intermediates (or the ones named on the command line) to CSV
+    names = sys.argv[1:] or [os.path.splitext(f)[0] for f in sorted(os.listdir(INTERMEDIATE_DIR)) if f.endswith('.parquet')]
+    for name in names:
+        csv_frame(load_intermediate(name), name).to_csv(intermediate_path(name, 'csv'), index=False)
+        print(f"Exported {name} to {intermediate_path(name, 'csv')}")
@@ -0,0 +1,194 @@
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+
+# Facts derived once per unique SMILES and shared by step5 (ionic liquid / dicationic checks) and
+# step7 (element filter). The cache is kept on disk, so only SMILES that no earlier run has seen
+# are examined; rows with an older MOLECULE_CACHE_VERSION are examined again.
+# Most SMILES are read by a lightweight atom tokenizer; RDKit is imported lazily and only parses
+# the strings the tokenizer cannot handle (or every string in validation mode). Tokenized SMILES
+# have no canonical SMILES.
+MOLECULE_CACHE_FILE = os.path.join("Intermediate_Data", "molecule_cache.csv")
+MOLECULE_CACHE_VERSION = 2
+FACT_COLUMNS = ['valid', 'canonical_smiles', 'elements', 'fragments', 'positive_charge', 'negative_charge', 'parser']
+CACHE_COLUMNS = ['smiles'] + FACT_COLUMNS + ['version']
+PARALLEL_THRESHOLD = 1000  # fewer SMILES than this are parsed by RDKit in-process
+
+
+# -------------------- Tokenizer --------------------
+ELEMENT_SYMBOLS = set("""H He Li Be B C N O F Ne Na Mg Al Si P S Cl Ar K Ca Sc Ti V Cr Mn Fe Co Ni Cu Zn Ga Ge As Se Br
+Kr Rb Sr Y Zr Nb Mo Tc Ru Rh Pd Ag Cd In Sn Sb Te I Xe Cs Ba La Ce Pr Nd Pm Sm Eu Gd Tb Dy Ho Er Tm Yb Lu Hf Ta W Re
+Os Ir Pt Au Hg Tl Pb Bi Po At Rn Fr Ra Ac Th Pa U Np Pu Am Cm Bk Cf Es Fm Md No Lr Rf Db Sg Bh Hs Mt Ds Rg Cn Nh Fl
+Mc Lv Ts Og""".split())
+AROMATIC_SYMBOLS = {'b': 'B', 'c': 'C', 'n': 'N', 'o': 'O', 'p': 'P', 's': 'S', 'se': 'Se', 'as': 'As', 'te': 'Te'}
+SMILES_TOKEN = re.compile(r"\[([^\[\]]*)\]|(Cl|Br|[BCNOPSFI]|[bcnops])|(%\d{2}|\d)|([-=#$:/\\.()])")
+BRACKET_ATOM = re.compile(r"(\d*)(se|as|te|[A-Z][a-z]?|[bcnops])(@[A-Z]{2}\d+|@@|@)?(H\d*)?([+-]\d+|\++|-+)?(:\d+)?$")
+
+
+def tokenize_smiles(smiles):
+    """
+    Read element symbols, formal charges and the fragment count directly from a SMILES string.
+    Returns None for strings the tokenizer does not handle (syntax errors, wildcards, plain [H]
+    atoms that RDKit may remove, ring bonds spanning a '.'), which are left to RDKit.
+    """
+    elements, positive, negative, fragments = set(), 0, 0, 1
+    atoms, depth, open_rings, position = 0, 0, set(), 0
+    for match in SMILES_TOKEN.finditer(smiles):
+        if match.start() != position:
+            return None
+        position = match.end()
+        bracket, organic, ring, symbol = match.groups()
+        if bracket is not None:
+            atom = BRACKET_ATOM.match(bracket)
+            if atom is None:
+                return None
+            isotope, element, _, hydrogens, charge, _ = atom.groups()
+            element = AROMATIC_SYMBOLS.get(element, element)
+            if element not in ELEMENT_SYMBOLS or (element == 'H' and not (isotope or hydrogens or charge)):
+                return None
+            if charge:
+                value = int(charge[1:]) if charge[1:].isdigit() else len(charge)
+                if charge[0] == '+':
+                    positive += value
+                else:
+                    negative += value
+            elements.add(element)
+            atoms += 1
+        elif organic is not None:
+            elements.add(AROMATIC_SYMBOLS.get(organic, organic))
+            atoms += 1
+        elif ring is not None:
+            if not atoms:
+                return None
+            open_rings ^= {ring}
+        elif symbol == '(':
+            depth += 1
+        elif symbol == ')':
+            depth -= 1
+            if depth < 0:
+                return None
+        elif symbol == '.':
+            if not atoms or depth or open_rings:
+                return None
+            fragments, atoms = fragments + 1, 0
+    if position != len(smiles) or not atoms or depth or open_rings:
+        return None
+    return {'valid': True, 'canonical_smiles': None, 'elements': ' '.join(sorted(elements)), 'fragments': fragments,
+            'positive_charge': positive, 'negative_charge': negative, 'parser': 'tokenizer'}
+
+
+# -------------------- RDKit --------------------
+_chem = None
+
+
+def rdkit_chem():
+    """Import RDKit on first use (it is not needed while the tokenizer handles every SMILES)."""
+    global _chem
+    if _chem is None:
+        from rdkit import Chem, RDLogger
+        RDLogger.DisableLog('rdApp.*')  # unparsable SMILES are recorded in the cache instead of logged
+        _chem = Chem
+    return _chem
+
+
+def text_facts(smiles):
+    """Fallback facts for SMILES RDKit cannot parse: charges and fragments counted in the string."""
+    return {'valid': False, 'canonical_smiles': None, 'elements': '', 'fragments': smiles.count('.') + 1,
+            'positive_charge': smiles.count('+'), 'negative_charge': smiles.count('-'), 'parser': 'text'}
+
+
+def describe_smiles(smiles):
+    """Parse one SMILES with RDKit and return its facts (elements as a sorted, space-separated string)."""
+    Chem = rdkit_chem()
+    mol = Chem.MolFromSmiles(smiles)
+    if mol is None:
+        return text_facts(smiles)
+    ptable = Chem.GetPeriodicTable()
+    charges = [atom.GetFormalCharge() for atom in mol.GetAtoms()]
+    return {'valid': True, 'canonical_smiles': Chem.MolToSmiles(mol),
+            'elements': ' '.join(sorted({ptable.GetElementSymbol(atom.GetAtomicNum()) for atom in mol.GetAtoms()})),
+            'fragments': len(Chem.GetMolFrags(mol)),
+            'positive_charge': sum(c for c in charges if c > 0), 'negative_charge': -sum(c for c in charges if c < 0),
+            'parser': 'rdkit'}
+
+
+def describe_all(smiles_list, max_workers=None, use_tokenizer=True):
+    """Describe smiles_list, tokenizing what the tokenizer handles and parsing the rest with RDKit."""
+    facts = [tokenize_smiles(smiles) if use_tokenizer else None for smiles in smiles_list]
+    pending = [i for i, fact in enumerate(facts) if fact is None]
+    if len(pending) < PARALLEL_THRESHOLD or max_workers == 1:
+        parsed = [describe_smiles(smiles_list[i]) for i in pending]
+    else:
+        max_workers = max_workers or os.cpu_count()
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            parsed = list(executor.map(describe_smiles, [smiles_list[i] for i in pending],
+                                       chunksize=max(1, len(pending) // (4 * max_workers))))
+    for i, fact in zip(pending, parsed):
+        facts[i] = fact
+    return facts
+
+
+class MoleculeCache:
+    """On-disk table of molecule facts keyed by SMILES."""
+
+    def __init__(self, file_path=MOLECULE_CACHE_FILE):
+        self.file_path = file_path
+        self.new_rows = 0
+        if os.path.exists(file_path):
+            table = pd.read_csv(file_path, dtype={'smiles': str, 'canonical_smiles': str, 'elements': str, 'parser': str},
+                                keep_default_na=False, na_values={'canonical_smiles': ['']})
+            table = table[table['version'] == MOLECULE_CACHE_VERSION]
+        else:
+            table = pd.DataFrame(columns=CACHE_COLUMNS)
+        self.table = table.set_index('smiles')
+
+    def facts(self, smiles, max_workers=None):
+        """
+        Return the facts of the unique strings in smiles (an iterable of SMILES; missing values are
+        ignored) as a DataFrame indexed by SMILES. SMILES not in the cache are parsed once.
+        """
+        unique = pd.unique(pd.Series(smiles, dtype=object).dropna())
+        missing = [s for s in unique if isinstance(s, str) and s not in self.table.index]
+        if missing:
+            new = pd.DataFrame(describe_all(missing, max_workers), index=pd.Index(missing, name='smiles'))
+            new['version'] = MOLECULE_CACHE_VERSION
+            self.table = pd.concat([self.table, new[FACT_COLUMNS + ['version']]]) if len(self.table) else new
+            self.new_rows += len(missing)
+        return self.table.loc[[s for s in unique if isinstance(s, str)], FACT_COLUMNS]
+
+    def save(self):
+        if not self.new_rows:
+            return
+        os.makedirs(os.path.dirname(self.file_path) or '.', exist_ok=True)
+        self.table.reset_index()[CACHE_COLUMNS].to_csv(self.file_path, index=False)
+        print(f"{self.new_rows} new molecules added to {self.file_path}.")
+        self.new_rows = 0
+
+
+def element_sets(facts):
+    """Map SMILES -> set of element symbols (empty for unparsable SMILES)."""
+    return facts['elements'].map(lambda elements: set(elements.split()) if isinstance(elements, str) else set())
+
+
+def validate_tokenizer(smiles, max_workers=None):
+    """Differential check: return the SMILES whose tokenizer facts differ from RDKit's."""
+    smiles = [s for s in pd.unique(pd.Series(smiles, dtype=object).dropna()) if isinstance(s, str)]
+    tokenized = pd.DataFrame(describe_all(smiles, use_tokenizer=True, max_workers=1), index=smiles)
+    parsed = pd.DataFrame(describe_all(smiles, use_tokenizer=False, max_workers=max_workers), index=smiles)
+    compared = ['elements', 'fragments', 'positive_charge', 'negative_charge']
+    checked = tokenized['parser'] == 'tokenizer'
+    differs = checked & (tokenized[compared] != parsed[compared]).any(axis=1)
+    print(f"{checked.sum()} of {len(smiles)} SMILES tokenized, {differs.sum()} differ from RDKit.")
+    return pd.concat([tokenized[differs], parsed[differs]], axis=1, keys=['tokenizer', 'rdkit'])
+
+
+if __name__ == "__main__":
+    # python molecule_cache.py --validate: compare the tokenizer with RDKit on every registered SMILES
+    if '--validate' in sys.argv[1:]:
+        from entry_tables import load_registry
+        mismatches = validate_tokenizer(load_registry()['smiles'])
+        if len(mismatches):
+            mismatches.to_csv('Intermediate_Data/molecule_cache_tokenizer_mismatches.csv')
+            print("Check 'molecule_cache_tokenizer_mismatches.csv'.")
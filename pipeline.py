@@ -0,0 +1,355 @@
+"""
+Runs a range of pipeline steps in one process, passing the DataFrames between steps in memory.
+
+Intermediates are only written when checkpoints are requested. A run can start at any step whose
+inputs were checkpointed before (by an earlier pipeline run or by the standalone step scripts);
+without an explicit start step the run resumes after the latest usable checkpoint.
+
+Every saved output is tagged with a key hashing the step's input data, parameters, step1 side
+tables and code. With memoize=True all outputs are saved and a step whose stored outputs carry
+the current key is skipped, so only steps downstream of a change are recomputed (like make).
+
+Usage: python pipeline.py [--start N] [--stop N] [--checkpoint] [--memoize] [--check-memoization]
+"""
+import os
+import json
+import hashlib
+import argparse
+from entry_tables import ENTRIES_FILE, REFS_FILE, COMPONENTS_FILE, REGISTRY_FILE
+from ref_index import REF_INDEX_FILE
+from intermediate_store import INTERMEDIATE_DIR, intermediate_exists, load_intermediate, stored_path
+
+STATE_FILE = os.path.join(INTERMEDIATE_DIR, "pipeline_state.json")
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SEARCH_PARAMS = {
+    "prop_key": "BPpY",  # Activity coefficient
+    "n_compounds": 2,
+}
+
+
+# -------------------- Steps --------------------
+# Each step receives its input frames (in the order of 'inputs') and returns a dict with its
+# output frames keyed by intermediate name. Step1 always writes its raw dataset and entry tables
+# and step10 always writes the final dataset; the other steps only write when save=True.
+def run_step1(save, search_params=SEARCH_PARAMS):
+    from step1_retrieving_data import get_and_combine_data
+    if get_and_combine_data(search_params) is None:
+        raise RuntimeError("Step 1 retrieved no data (empty search or retrieval error, see the messages above).")
+    return {'step1_raw_activity_data': load_intermediate('step1_raw_activity_data')}
+
+
+def run_step2(raw_data, save):
+    from step2_decode_data import docode_data
+    return {'step2_columns_adjusted': docode_data(raw_data, save=save)}
+
+
+def run_step3(df, save):
+    from step3_get_smiles import get_smiles
+    return {'step3_smiles_added': get_smiles(df, save=save)}
+
+
+def run_step4(df, save):
+    from step4_missing_smiles import missing_smiles
+    return {'step4_missing_smiles_added': missing_smiles(df, save=save)}
+
+
+def run_step5(df, save):
+    from step5_place_smiles import place_smiles
+    return {'step5_place_smiles_for_IL_and_solute': place_smiles(df, save=save)}
+
+
+def run_step6(df, save):
+    from step6_duplicate_refs import duplicate_refs
+    return {'step6_activity_data_removed_duplicate_refs': duplicate_refs(df, save=save)}
+
+
+def run_step7(df, save):
+    from step7_elemental_filter import elemental_filtering
+    return {'step7_activity_data_elements_filtered': elemental_filtering(df, save=save)}
+
+
+def run_step8(df, save):
+    from step8_gibbs_helmholtz import gibbs_helmholtz_coefficients
+    gh_df, multiple_ref, single_ref_multiple_entry, single_ref_single_entry = gibbs_helmholtz_coefficients(
+        df, threshold=step8_params(), save=save)
+    return {'step8_gh_total': gh_df,
+            'step8_gh_multiple_ref_combinations': multiple_ref,
+            'step8_single_ref_multiple_entry': single_ref_multiple_entry,
+            'step8_single_ref_single_entry': single_ref_single_entry}
+
+
+def run_step9(multiple_ref, single_ref_multiple_entry, save):
+    from step9_conflict_handling import conflict_handling, process_entry_id_column
+    df1 = process_entry_id_column(multiple_ref.copy())
+    df2 = process_entry_id_column(single_ref_multiple_entry.copy())
+    multi_resolved, single_resolved, multi_pairs, single_pairs = conflict_handling(df1, df2, 'multi', 'single', save=save)
+    return {'step9_conflicted_data_resolved_multi': multi_resolved,
+            'step9_conflicted_data_resolved_single': single_resolved,
+            'step9_group_pairs_multi': multi_pairs,
+            'step9_group_pairs_single': single_pairs}
+
+
+def run_step10(multi_resolved, single_resolved, single_df, filtered_activity_df, save):
+    from step10_final_cleaning import finalizing_data
+    final_df = finalizing_data(multi_resolved.copy(), single_resolved.copy(), single_df.copy(), filtered_activity_df)
+    return {'step10_final_refined_activity_dataset': final_df}
+
+
+# -------------------- Step Parameters --------------------
+# Module-level settings a step's result depends on (read at run time, so overrides count)
+def step2_params():
+    import step2_decode_data
+    return step2_decode_data.DECODING_RULES
+
+
+def step7_params():
+    import step7_elemental_filter
+    return step7_elemental_filter.ALLOWED_ELEMENTS
+
+
+def step8_params():
+    import step8_gibbs_helmholtz
+    return step8_gibbs_helmholtz.threshold
+
+
+def step9_params():
+    import step9_conflict_handling
+    return step9_conflict_handling.threshold
+
+
+# inputs/outputs: intermediates read and written; code: source files whose changes invalidate the
+# step (intermediate_store.py for every step that loads or saves intermediates); tables: side
+# tables the step reads; writes: tables the step also rewrites (see table_keys); params: settings;
+# always_saved: writes even without save
+STEPS = {
+    1: {'inputs': [], 'run': run_step1, 'always_saved': True,
+        'outputs': ['step1_raw_activity_data']},
+    2: {'inputs': ['step1_raw_activity_data'], 'run': run_step2, 'params': step2_params,
+        'code': ['step2_decode_data.py', 'entry_tables.py', 'intermediate_store.py'], 'tables': [ENTRIES_FILE],
+        'outputs': ['step2_columns_adjusted']},
+    3: {'inputs': ['step2_columns_adjusted'], 'run': run_step3,
+        'code': ['step3_get_smiles.py', 'entry_tables.py', 'intermediate_store.py'], 'tables': [COMPONENTS_FILE, REGISTRY_FILE],
+        'writes': [COMPONENTS_FILE, REGISTRY_FILE], 'outputs': ['step3_smiles_added']},
+    4: {'inputs': ['step3_smiles_added'], 'run': run_step4,
+        'code': ['step4_missing_smiles.py', 'entry_tables.py', 'intermediate_store.py'], 'tables': [COMPONENTS_FILE, REGISTRY_FILE],
+        'writes': [COMPONENTS_FILE, REGISTRY_FILE], 'outputs': ['step4_missing_smiles_added']},
+    5: {'inputs': ['step4_missing_smiles_added'], 'run': run_step5,
+        'code': ['step5_place_smiles.py', 'entry_tables.py', 'molecule_cache.py', 'intermediate_store.py'], 'tables': [REGISTRY_FILE],
+        'outputs': ['step5_place_smiles_for_IL_and_solute']},
+    6: {'inputs': ['step5_place_smiles_for_IL_and_solute'], 'run': run_step6,
+        'code': ['step6_duplicate_refs.py', 'entry_tables.py', 'ref_index.py', 'intermediate_store.py'], 'tables': [ENTRIES_FILE, REFS_FILE, REF_INDEX_FILE],
+        'writes': [REF_INDEX_FILE], 'outputs': ['step6_activity_data_removed_duplicate_refs']},
+    7: {'inputs': ['step6_activity_data_removed_duplicate_refs'], 'run': run_step7, 'params': step7_params,
+        'code': ['step7_elemental_filter.py', 'entry_tables.py', 'molecule_cache.py', 'dedup.py', 'intermediate_store.py'], 'tables': [ENTRIES_FILE, REFS_FILE],
+        'outputs': ['step7_activity_data_elements_filtered']},
+    8: {'inputs': ['step7_activity_data_elements_filtered'], 'run': run_step8, 'params': step8_params,
+        'code': ['step8_gibbs_helmholtz.py', 'gh_regression.py', 'intermediate_store.py'],
+        'outputs': ['step8_gh_total', 'step8_gh_multiple_ref_combinations',
+                    'step8_single_ref_multiple_entry', 'step8_single_ref_single_entry']},
+    9: {'inputs': ['step8_gh_multiple_ref_combinations', 'step8_single_ref_multiple_entry'], 'run': run_step9,
+        'params': step9_params, 'code': ['step9_conflict_handling.py', 'gh_regression.py', 'intermediate_store.py'],
+        'outputs': ['step9_conflicted_data_resolved_multi', 'step9_conflicted_data_resolved_single',
+                    'step9_group_pairs_multi', 'step9_group_pairs_single']},
+    10: {'inputs': ['step9_conflicted_data_resolved_multi', 'step9_conflicted_data_resolved_single',
+                    'step8_single_ref_single_entry', 'step7_activity_data_elements_filtered'], 'run': run_step10,
+         'code': ['step10_final_cleaning.py', 'dedup.py', 'intermediate_store.py'], 'tables': [os.path.join(INTERMEDIATE_DIR, 'step7_initial_ref_ids.csv')],
+         'always_saved': True, 'outputs': ['step10_final_refined_activity_dataset']},
+}
+
+
+# -------------------- Step Keys --------------------
+def load_state(state_file=STATE_FILE):
+    """Load the recorded key and file stat of every saved output (name -> record)."""
+    if not os.path.exists(state_file):
+        return {}
+    with open(state_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(state, state_file=STATE_FILE):
+    os.makedirs(os.path.dirname(state_file), exist_ok=True)
+    tmp_path = state_file + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, state_file)
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_stat(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def canonical(obj):
+    """JSON-serializable form of a parameter value that does not depend on dict or set order."""
+    if isinstance(obj, dict):
+        return sorted([canonical(k), canonical(v)] for k, v in obj.items())
+    if isinstance(obj, (set, frozenset)):
+        return sorted(canonical(v) for v in obj)
+    if isinstance(obj, (list, tuple)):
+        return [canonical(v) for v in obj]
+    if obj is None or isinstance(obj, (str, int, float, bool)):
+        return obj
+    return repr(obj)
+
+
+def artifact_key(name, state):
+    """Key of a stored intermediate: its recorded key if the file is unchanged, else its content hash."""
+    path = stored_path(name)
+    record = state.get(name)
+    if record and record['stat'] == file_stat(path):
+        return record['key']
+    return file_digest(path)
+
+
+def table_keys(step, state):
+    """
+    Key of every side table a step reads: its content hash. A table the step also writes keeps the
+    key it had when the step last ran as long as no one but the pipeline has changed it since, so a
+    step's own writes (and those of later steps) do not invalidate it.
+    """
+    keys = {}
+    for table in STEPS[step].get('tables', []):
+        keys[table] = file_digest(table) if os.path.exists(table) else None
+        record = state.get('side_tables', {}).get(table)
+        if table in STEPS[step].get('writes', []) and record and record['digest'] == keys[table]:
+            keys[table] = record['read_by'].get(str(step), keys[table])
+    return keys
+
+
+def record_writes(step, tables, state):
+    """Record the table keys a step ran with and the content of the tables it wrote."""
+    for table in STEPS[step].get('writes', []):
+        record = state.setdefault('side_tables', {}).setdefault(table, {'read_by': {}})
+        record['read_by'][str(step)] = tables[table]
+        record['digest'] = file_digest(table) if os.path.exists(table) else None
+
+
+def step_key(step, input_keys, tables):
+    """Hash of everything a step's result depends on (tables: see table_keys)."""
+    spec = STEPS[step]
+    payload = {
+        'step': step,
+        'inputs': input_keys,
+        'code': {f: file_digest(os.path.join(CODE_DIR, f)) for f in spec.get('code', [])},
+        'tables': tables,
+        'params': canonical(spec['params']()) if 'params' in spec else None,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def output_keys(step, key):
+    return {name: hashlib.sha256(f"{key}:{name}".encode("utf-8")).hexdigest() for name in STEPS[step]['outputs']}
+
+
+def up_to_date(name, key, state):
+    record = state.get(name)
+    path = stored_path(name)
+    return bool(record) and path is not None and record['key'] == key and record['stat'] == file_stat(path)
+
+
+# -------------------- Runner --------------------
+def external_inputs(start, stop):
+    """Intermediates read by steps start..stop that are not produced within that range."""
+    produced, needed = set(), []
+    for step in range(start, stop + 1):
+        needed += [name for name in STEPS[step]['inputs'] if name not in produced and name not in needed]
+        produced.update(STEPS[step]['outputs'])
+    return needed
+
+
+def resume_point(stop=max(STEPS)):
+    """Return the latest start step whose inputs are all available as checkpoints."""
+    for start in range(stop, min(STEPS) - 1, -1):
+        if all(intermediate_exists(name) for name in external_inputs(start, stop)):
+            return start
+    return min(STEPS)
+
+
+def run_pipeline(start=None, stop=max(STEPS), checkpoint=False, search_params=SEARCH_PARAMS, memoize=False):
+    """
+    Runs steps start..stop in this process and returns the frames of the last run step
+    (an empty dict if it was skipped).
+
+    Args:
+        start: First step to run; None resumes after the latest usable checkpoint (with memoize,
+            None starts at step2 once the raw dataset exists, since step1 queries ILThermo).
+        stop: Last step to run.
+        checkpoint: True to save the output of every step, or a collection of step numbers to
+            save only those.
+        search_params: ILThermo search parameters for step1.
+        memoize: Save every output and skip steps whose saved outputs match their current key.
+    """
+    if start is None:
+        start = (2 if intermediate_exists(STEPS[1]['outputs'][0]) else 1) if memoize else resume_point(stop)
+    missing = [name for name in external_inputs(start, stop) if not intermediate_exists(name)]
+    if missing:
+        raise FileNotFoundError(f"Cannot start at step {start}: no checkpoint for {', '.join(missing)}")
+    print(f"Running steps {start}-{stop}")
+
+    state = load_state()
+    keys, frames, outputs = {}, {}, {}
+    for step in range(start, stop + 1):
+        spec = STEPS[step]
+        save = memoize or checkpoint is True or (checkpoint is not False and step in checkpoint)
+        tables = table_keys(step, state)
+        key = step_key(step, [keys[name] if name in keys else artifact_key(name, state) for name in spec['inputs']], tables)
+        keys.update(output_keys(step, key))
+
+        if memoize and step != 1 and all(up_to_date(name, keys[name], state) for name in spec['outputs']):
+            print(f"---- Step {step}: up to date, skipped ----")
+            outputs = {}
+        else:
+            print(f"---- Step {step} ----")
+            inputs = [frames[name] if name in frames else load_intermediate(name) for name in spec['inputs']]
+            if step == 1:
+                outputs = spec['run'](save, search_params=search_params)
+            else:
+                outputs = spec['run'](*inputs, save=save)
+            frames.update(outputs)
+            if save or spec.get('always_saved'):
+                for name in spec['outputs']:
+                    path = stored_path(name)
+                    if step == 1:  # ILThermo data: keyed by content
+                        keys[name] = file_digest(path)
+                    state[name] = {'key': keys[name], 'stat': file_stat(path)}
+                record_writes(step, tables, state)
+                save_state(state)
+
+        # Release frames that no later step reads
+        needed = {name for later in range(step + 1, stop + 1) for name in STEPS[later]['inputs']}
+        frames = {name: df for name, df in frames.items() if name in needed}
+    return outputs
+
+
+def check_memoization(start=None, stop=max(STEPS)):
+    """Run steps start..stop twice with memoize=True and check that the second run skips every step."""
+    run_pipeline(start, stop, memoize=True)
+    state = load_state()
+    run_pipeline(start, stop, memoize=True)
+    new_state = load_state()
+    rerun = sorted(name for name in set(state) | set(new_state) if state.get(name) != new_state.get(name))
+    assert not rerun, f"The second memoized run rewrote {', '.join(rerun)}"
+    print("Memoization check passed: the second run skipped every step.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run pipeline steps in one process.")
+    parser.add_argument("--start", type=int, default=None, help="first step (default: resume from the latest checkpoint)")
+    parser.add_argument("--stop", type=int, default=max(STEPS), help="last step")
+    parser.add_argument("--checkpoint", action="store_true", help="save the output of every step")
+    parser.add_argument("--memoize", action="store_true", help="skip steps whose inputs, parameters and code are unchanged")
+    parser.add_argument("--check-memoization", action="store_true", help="run twice with --memoize; the second run must skip every step")
+    args = parser.parse_args()
+    if args.check_memoization:
+        check_memoization(args.start, args.stop)
+    else:
+        run_pipeline(args.start, args.stop, checkpoint=args.checkpoint, memoize=args.memoize)
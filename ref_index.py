@@ -0,0 +1,234 @@
+import os
+import re
+import ast
+import zlib
+import hashlib
+import tempfile
+import unicodedata
+from collections import defaultdict
+import numpy as np
+import pandas as pd
+
+# Structured reference index used by step6 to detect duplicate references. Every ref is parsed
+# once into title, authors, year and DOI; duplicates are found through a hash index of the
+# normalized title and, for near-duplicates, a MinHash/LSH candidate index. The index is kept
+# on disk so that later runs only parse and compare references they have not seen before.
+# A near-duplicate title only joins a cluster when year, first author and source (journal,
+# volume and pages) agree as well: series papers of one group in one year often differ in a
+# single word of the title. Otherwise the ref keeps its own cluster and records the suspected
+# cluster in near_of, which step6 reports without removing any rows.
+REF_INDEX_FILE = os.path.join("Intermediate_Data", "ref_index.csv")
+INDEX_COLUMNS = ['ref_hash', 'title', 'authors', 'year', 'source', 'doi', 'title_key', 'cluster', 'match', 'near_of',
+                 'minhash']
+
+SHINGLE_SIZE = 5      # character shingles of the normalized title
+NUM_PERM = 64         # MinHash signature length
+BANDS = 16            # LSH bands of NUM_PERM // BANDS rows each
+NEAR_THRESHOLD = 0.9  # Jaccard similarity of title shingles above which two refs are duplicates
+
+_PRIME = np.uint64(4294967311)  # smallest prime above 2**32
+_rng = np.random.default_rng(20240604)
+_A = _rng.integers(1, 2**29, NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, 2**29, NUM_PERM, dtype=np.uint64)
+
+
+# -------------------- Parsing --------------------
+def ref_hash(ref_text):
+    """Stable key of a stringified ref (ref_ids are reassigned when step1 rebuilds its tables)."""
+    return hashlib.sha1(str(ref_text).encode('utf-8')).hexdigest()
+
+
+def parse_ref(ref_text):
+    """Split a stringified ILThermo ref dict into title, authors, year, source (journal, volume, pages) and DOI."""
+    try:
+        ref = ast.literal_eval(ref_text) if isinstance(ref_text, str) else {}
+    except (ValueError, SyntaxError):
+        ref = {}
+    if not isinstance(ref, dict):
+        ref = {}
+    title, full = ref.get('title'), ref.get('full')
+    if title is None and isinstance(ref_text, str):
+        match = re.search(r"'title':\s*'([^']+)'|\"title\":\s*\"([^\"]+)\"", ref_text)
+        title = (match.group(1) or match.group(2)) if match else None
+    full = full if isinstance(full, str) else (ref_text if not ref and isinstance(ref_text, str) else '')
+    year = re.search(r"\((\d{4})\)", full) or re.search(r"\b((?:18|19|20)\d{2})\b", full)
+    doi = re.search(r"\b10\.\d{4,9}/[^\s,;]+", full)
+    authors = full[:year.start()].strip(' ,;') if year else ''
+    source = None
+    if year:
+        source = normalize_title(full[year.end():doi.start() if doi and doi.start() > year.end() else None])
+        if source and normalize_title(title):  # some citations repeat the title
+            source = normalize_title(re.sub(rf"\b{re.escape(normalize_title(title))}\b", ' ', source))
+    return {'title': title, 'authors': authors or None, 'year': int(year.group(1)) if year else None,
+            'source': source if source and re.search(r"\d", source) else None,
+            'doi': doi.group(0).rstrip('.').lower() if doi else None}
+
+
+def normalize_title(title):
+    """Case-, accent-, whitespace- and punctuation-insensitive form of a title."""
+    if not isinstance(title, str):
+        return None
+    title = unicodedata.normalize('NFKD', title)
+    title = ''.join(c for c in title if not unicodedata.combining(c)).lower()
+    title = re.sub(r"[^0-9a-z]+", " ", title).strip()
+    return title or None
+
+
+def first_author(authors):
+    """Normalized surname of the first author ('Domańska, U.; Marciniak, A.' -> 'domanska')."""
+    first = normalize_title(authors.split(';')[0]) if isinstance(authors, str) else None
+    names = [name for name in first.split() if len(name) > 1] if first else []
+    return names[0] if names else None
+
+
+# -------------------- MinHash / LSH --------------------
+def shingles(title_key):
+    if len(title_key) <= SHINGLE_SIZE:
+        return {title_key}
+    return {title_key[i:i + SHINGLE_SIZE] for i in range(len(title_key) - SHINGLE_SIZE + 1)}
+
+
+def minhash(title_key):
+    """MinHash signature of the title shingles (NUM_PERM universal hashes of crc32 values)."""
+    values = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles(title_key)), dtype=np.uint64)
+    return ((_A[:, None] * values[None, :] + _B[:, None]) % _PRIME).min(axis=1)
+
+
+def band_keys(signature):
+    rows = NUM_PERM // BANDS
+    return [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(BANDS)]
+
+
+def jaccard(key_1, key_2):
+    s1, s2 = shingles(key_1), shingles(key_2)
+    return len(s1 & s2) / len(s1 | s2)
+
+
+# -------------------- Index --------------------
+class RefIndex:
+    """
+    Assigns every reference to a duplicate cluster. A new ref joins the cluster of an indexed ref
+    with the same normalized title (or DOI), or of the most similar LSH candidate whose title
+    shingles reach NEAR_THRESHOLD and whose year, first author and source agree; otherwise it starts
+    a cluster of its own. A near candidate with any other citation detail is only reported.
+    """
+
+    def __init__(self, file_path=REF_INDEX_FILE):
+        self.file_path = file_path
+        if os.path.exists(file_path):
+            self.table = pd.read_csv(file_path, dtype={**{col: str for col in INDEX_COLUMNS}, 'year': 'Int64'})
+        else:
+            self.table = pd.DataFrame(columns=INDEX_COLUMNS)
+        if not set(INDEX_COLUMNS) <= set(self.table.columns):
+            # Indexes written before near matches were confirmed may hold wrong clusters: rebuild
+            print(f"Rebuilding {file_path}: near-duplicate matches are now confirmed by year, first author and source.")
+            self.table = pd.DataFrame(columns=INDEX_COLUMNS)
+        self.new_rows = []
+        self.by_hash, self.by_key, self.by_doi, self.buckets = {}, {}, {}, defaultdict(list)
+        self.near_of = {}
+        for row in self.table.itertuples(index=False):
+            self._add_to_index(row.ref_hash, row.title_key, row.doi, row.cluster,
+                               np.array(row.minhash.split(), dtype=np.uint64) if isinstance(row.minhash, str) else None,
+                               (None if pd.isna(row.year) else int(row.year), first_author(row.authors),
+                                row.source if isinstance(row.source, str) else None),
+                               row.near_of if isinstance(row.near_of, str) else None)
+
+    def _add_to_index(self, key, title_key, doi, cluster, signature, citation, near_of):
+        self.by_hash[key] = cluster
+        if near_of is not None:
+            self.near_of[key] = near_of
+        if isinstance(title_key, str):
+            self.by_key.setdefault(title_key, cluster)
+        if isinstance(doi, str):
+            self.by_doi.setdefault(doi, cluster)
+        if signature is not None:
+            for band in band_keys(signature):
+                self.buckets[band].append((title_key, cluster, citation))
+
+    def _match(self, title_key, doi, signature, citation):
+        """Return (cluster, match type, suspected cluster) of the indexed ref that title_key duplicates."""
+        if title_key in self.by_key:
+            return self.by_key[title_key], 'title', None
+        if doi in self.by_doi:
+            return self.by_doi[doi], 'doi', None
+        if signature is None:
+            return None, None, None
+        best = {True: (NEAR_THRESHOLD, None), False: (NEAR_THRESHOLD, None)}
+        seen = set()
+        for band in band_keys(signature):
+            for candidate in self.buckets.get(band, []):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                candidate_key, cluster, candidate_citation = candidate
+                confirmed = None not in citation and citation == candidate_citation
+                similarity = jaccard(title_key, candidate_key)
+                if similarity >= best[confirmed][0]:
+                    best[confirmed] = (similarity, cluster)
+        if best[True][1] is not None:
+            return best[True][1], 'near', None
+        if best[False][1] is not None:
+            return None, 'near_unconfirmed', best[False][1]
+        return None, None, None
+
+    def add(self, ref_text):
+        """Index ref_text (if new) and return its cluster."""
+        key = ref_hash(ref_text)
+        if key in self.by_hash:
+            return self.by_hash[key]
+        fields = parse_ref(ref_text)
+        title_key = normalize_title(fields['title'])
+        signature = minhash(title_key) if title_key else None
+        citation = (fields['year'], first_author(fields['authors']), fields['source'])
+        cluster, match, near_of = self._match(title_key, fields['doi'], signature, citation)
+        cluster = cluster or key
+        self._add_to_index(key, title_key, fields['doi'], cluster, signature, citation, near_of)
+        self.new_rows.append({'ref_hash': key, **fields, 'title_key': title_key, 'cluster': cluster, 'match': match,
+                              'near_of': near_of, 'minhash': ' '.join(map(str, signature)) if signature is not None else None})
+        return cluster
+
+    def clusters(self, refs):
+        """Return the cluster of every ref in refs (a Series of stringified ref dicts)."""
+        return refs.map(self.add)
+
+    def suspected(self, refs):
+        """Return the cluster each ref in refs nearly duplicates without a matching citation (else None)."""
+        return refs.map(lambda ref_text: self.near_of.get(ref_hash(ref_text)))
+
+    def save(self):
+        if not self.new_rows:
+            return
+        os.makedirs(os.path.dirname(self.file_path) or '.', exist_ok=True)
+        self.table = pd.concat([self.table, pd.DataFrame(self.new_rows, columns=INDEX_COLUMNS)], ignore_index=True)
+        self.table.to_csv(self.file_path, index=False)
+        print(f"{len(self.new_rows)} new references added to {self.file_path}.")
+        self.new_rows = []
+
+
+def check_series_refs():
+    """
+    Regression check: papers of one series (same authors and year, titles differing in one word)
+    stay in separate clusters and are only reported, while the same citation with a retyped title
+    is still merged.
+    """
+    template = "{{'full': 'Domanska, U.; Marciniak, A. ({year}) J. Chem. Thermodyn. {source}', 'title': '{title}'}}"
+    title = ("Activity coefficients at infinite dilution measurements for organic solutes and water in the ionic "
+             "liquid 1-{chain}-3-methylimidazolium trifluoromethanesulfonate")
+    butyl = template.format(year=2008, source='40, 860-866', title=title.format(chain='butyl'))
+    hexyl = template.format(year=2008, source='40, 1250-1256', title=title.format(chain='hexyl'))
+    retyped = template.format(year=2008, source='40, 860-866', title=title.format(chain='butyl').replace('measurements', 'measurments'))
+    series = "Phase equilibria of binary systems containing ionic liquids with organic solvents, number {}"
+    number_1 = template.format(year=2010, source='42, 100-110', title=series.format(1))
+    number_0 = template.format(year=2010, source='42, 200-210', title=series.format(0))
+
+    index = RefIndex(os.path.join(tempfile.mkdtemp(), "ref_index.csv"))  # not saved
+    refs = pd.Series([butyl, hexyl, retyped, number_1, number_0])
+    clusters, suspected = index.clusters(refs), index.suspected(refs)
+    assert clusters[0] != clusters[1] and clusters[3] != clusters[4], "series papers were merged"
+    assert suspected[1] == clusters[0] and suspected[4] == clusters[3], "series papers were not reported"
+    assert clusters[2] == clusters[0] and pd.isna(suspected[2]), "a retyped title of the same citation was not merged"
+    print("Series ref check passed: series papers are kept apart and reported, retyped citations merged.")
+
+
+if __name__ == "__main__":
+    check_series_refs()
@@ -1,38 +1,26 @@
 import pandas as pd
-import ast
+from dedup import drop_duplicate_keys
+from intermediate_store import load_intermediate
 
 def load_datasets():
-    multi_resolved = pd.read_csv("Intermediate_Data/step9_conflicted_data_resolved_multi.csv")
-    single_resolved = pd.read_csv("Intermediate_Data/step9_conflicted_data_resolved_single.csv")
-    single_df = pd.read_csv("Intermediate_Data/step8_single_ref_single_entry.csv")
-    filtered_activity_df = pd.read_csv("Intermediate_Data/step7_activity_data_elements_filtered.csv")
+    multi_resolved = load_intermediate("step9_conflicted_data_resolved_multi")
+    single_resolved = load_intermediate("step9_conflicted_data_resolved_single")
+    single_df = load_intermediate("step8_single_ref_single_entry", columns=['original_index'])
+    filtered_activity_df = load_intermediate("step7_activity_data_elements_filtered")
     return multi_resolved, single_resolved, single_df, filtered_activity_df
 
 
 
 def get_selected_indices(multi_resolved, single_resolved, single_df):
     def extract_sorted_indices(df):
-        # Identify the correct original_index_group_ column based on selected_group
-        def get_original_index(row):
-            if pd.notna(row['selected_group']):  # Ensure selected_group is not None
-                col_name = f'original_index_group_{int(row["selected_group"])}'
-                return eval(row[col_name]) if col_name in df.columns else []
-            return []
-
-        # Apply the function to extract indices
-        df['extracted_indices'] = df.apply(get_original_index, axis=1)
-
-        # Flatten, convert to int, get unique values, and sort
-        sorted_indices = sorted(set(int(i) for sublist in df['extracted_indices'] for i in sublist))
-        
-        return sorted_indices
+        # original_index lists of the selected group of every combination, flattened, unique and sorted
+        return sorted(set(int(i) for sublist in df.loc[df['selected'], 'original_index'] for i in sublist))
 
     # Extract sorted indices separately for multi_resolved and single_resolved
     multi_resolved_indices = extract_sorted_indices(multi_resolved)
     single_resolved_indices = extract_sorted_indices(single_resolved)
 
     # Extract sorted indices for single_df
-    single_df['original_index'] = single_df['original_index'].apply(eval)  # Convert string representation to list
     single_df_indices = sorted(single_df.explode('original_index')['original_index'].astype(int).unique())
 
     return multi_resolved_indices, single_resolved_indices, single_df_indices
@@ -66,15 +54,9 @@ def remove_duplicates(semi_final_filtered_activity_df):
     in agreement data from different ref_ids before Gibbs-Helmholtz processing.
     """
 
-    duplicates = semi_final_filtered_activity_df[
-        semi_final_filtered_activity_df.duplicated(subset=['IL_id', 'solute_id', 'temperature', 'gamma'], keep=False) 
-    ]
-    
-    duplicate_groups = duplicates.groupby(['IL_id', 'solute_id', 'temperature', 'gamma']).apply(lambda x: x.index.tolist()).reset_index(name='duplicate_indices')
-    indices_to_remove = duplicate_groups['duplicate_indices'].apply(lambda x: x[1:]).sum()
-    
-    final_filtered_activity_df = semi_final_filtered_activity_df.drop(indices_to_remove)
-    print(f"Removed {len(indices_to_remove)} duplicate rows.")
+    final_filtered_activity_df, report = drop_duplicate_keys(semi_final_filtered_activity_df, ['IL_id', 'solute_id', 'temperature', 'gamma'])
+    report.to_csv('Intermediate_Data/step10_duplicate_rows_report.csv', index=False)
+    print(f"Removed {report['dropped_rows'].sum()} duplicate rows.")
     return final_filtered_activity_df
 
 
@@ -108,8 +90,10 @@ def update_ref_ids(df):
 
 
 
-def finalizing_data():
-    multi_resolved, single_resolved, single_df, filtered_activity_df = load_datasets()
+def finalizing_data(multi_resolved=None, single_resolved=None, single_df=None, filtered_activity_df=None):
+    # Without frames passed in (e.g. by the pipeline runner) the datasets are loaded from Intermediate_Data
+    if multi_resolved is None:
+        multi_resolved, single_resolved, single_df, filtered_activity_df = load_datasets()
     multi_resolved_indices, single_resolved_indices, single_df_indices = get_selected_indices(multi_resolved, single_resolved, single_df)
     
     overlap_multiple_single_res = set(multi_resolved_indices).intersection(single_resolved_indices)
@@ -1,67 +1,208 @@
 import ilthermopy
 import pandas as pd
-import requests  # For handling timeouts
-import time
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from tqdm import tqdm
 import os
+import json
+import hashlib
+import shutil
+from intermediate_store import (IntermediateWriter, intermediate_exists, intermediate_columns,
+                                intermediate_path, iter_intermediate, load_intermediate, stored_path)
+from fetch_engine import fetch_entries, DEFAULT_MAX_IN_FLIGHT, DEFAULT_RATE_LIMIT
+from entry_tables import (ENTRIES_FILE, REFS_FILE, COMPONENTS_FILE, REGISTRY_FILE, ENTRY_COLUMNS,
+                          load_entries, load_refs, component_record, register_components)
 
-def process_entry(entry_id, max_retries=3, timeout=10):
-    """Processes a single entry with retries and timeout handling."""
-    for attempt in range(max_retries):
-        try:
-            entry = ilthermopy.GetEntry(entry_id)  # ilthermopy uses requests internally
-            
-            if entry is None:
-                print(f"Error: Could not retrieve entry with ID {entry_id}")
-                return None
-
-            data_df = entry.data
-            if data_df is None or data_df.empty:
-                print(f"Warning: No data found for entry ID {entry_id}")
-                return None
-
-            ref_dict = {}
-            if hasattr(entry.ref, '__dict__'):
-                ref_dict = entry.ref.__dict__
-            elif hasattr(entry.ref, 'to_dict'):
-                ref_dict = entry.ref.to_dict()
-            else:
-                ref_dict = str(entry.ref)
-
-            # Ensure metadata applies to all rows
-            metadata = {
-                'id': entry_id,
-                'ref': ref_dict,
-                'phases': entry.phases,
-                'expmeth': entry.expmeth,
-                'solvent': entry.solvent,
-                'property': entry.property,
-                'property_type': entry.property_type
-            }
-            
-            metadata_df = pd.DataFrame([metadata] * len(data_df))  # Duplicate metadata for all rows
-            combined_df_entry = pd.concat([metadata_df, data_df], axis=1)
-            return combined_df_entry
-        
-        except requests.exceptions.Timeout:
-            print(f"Timeout error for entry {entry_id} (attempt {attempt+1}/{max_retries}). Retrying...")
-        except requests.exceptions.RequestException as e:
-            print(f"Request error for entry {entry_id} (attempt {attempt+1}/{max_retries}): {e}")
-        except Exception as e:
-            print(f"Unexpected error processing entry {entry_id} (attempt {attempt+1}/{max_retries}): {e}")
-
-        # Wait before retrying (exponential backoff: 2s, 4s, 8s)
-        if attempt < max_retries - 1:
-            time.sleep(2 ** attempt)
-    
-    return None  # If all retries fail
+def process_entry(entry_id, entry):
+    """
+    Splits a single fetched entry into its metadata record and its measurement table.
+    The measurement table only carries the entry 'id'; metadata, including the component
+    details needed by steps 3 and 4, is stored once per entry.
+    """
+    data_df = entry.data
+    if data_df is None or data_df.empty:
+        print(f"Warning: No data found for entry ID {entry_id}")
+        return None
+
+    ref_dict = {}
+    if hasattr(entry.ref, '__dict__'):
+        ref_dict = entry.ref.__dict__
+    elif hasattr(entry.ref, 'to_dict'):
+        ref_dict = entry.ref.to_dict()
+    else:
+        ref_dict = str(entry.ref)
+
+    metadata = {
+        'id': entry_id,
+        'ref': str(ref_dict),  # interned to an integer ref_id when the entries table is written
+        'phases': entry.phases,
+        'expmeth': entry.expmeth,
+        'solvent': entry.solvent,
+        'property': entry.property,
+        'property_type': entry.property_type,
+        'components': component_record(entry_id, entry)
+    }
+
+    data_df = data_df.copy()
+    data_df.insert(0, 'id', entry_id)
+    return metadata, data_df
+
+
+def entry_fingerprint(metadata, data_df):
+    """Returns the row count and a content hash of a processed entry for the harvest manifest."""
+    payload = json.dumps(metadata, sort_keys=True) + data_df.to_csv(index=False)
+    digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    return {'rows': len(data_df), 'hash': digest}
+
+
+def manifest_path_for(name):
+    return os.path.join("Intermediate_Data", name + "_manifest.json")
+
+
+def load_manifest(manifest_path):
+    """Loads the manifest of previously harvested entry IDs ({entry_id: {'rows', 'hash'}})."""
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
 
 
-def get_and_combine_data(search_params, filename="step1_raw_activity_data.csv", max_workers=None):
+def rebuild_manifest(name):
     """
-    Searches ILThermo, retrieves data (parallelized), combines, and saves to CSV.
+    Rebuilds the manifest of a raw dataset written without one (e.g. before manifests were
+    recorded) from the entry IDs it contains. Content hashes cannot be recovered and are None.
+    """
+    counts = load_intermediate(name, columns=['id'])['id'].astype(str).value_counts(sort=False)
+    return {entry_id: {'rows': int(rows), 'hash': None} for entry_id, rows in counts.items()}
+
+
+def save_manifest(manifest, manifest_path):
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def chunk_dir_for(name):
+    return os.path.join("Intermediate_Data", name + "_chunks")
+
+
+def load_checkpoint(chunk_dir):
+    """
+    Reads the checkpoint of a (possibly interrupted) harvest.
+
+    Returns the list of completed chunk files, a dict of the entry IDs stored in them and
+    the metadata records of those entries.
+    Chunks written without a checkpoint record (crash in between) are ignored and refetched.
+    """
+    checkpoint_path = os.path.join(chunk_dir, "checkpoint.jsonl")
+    chunk_files, done, metadata = [], {}, []
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn write from a crashed run
+                chunk_files.append(os.path.join(chunk_dir, record['chunk']))
+                done.update(record['entries'])
+                metadata.extend(record['metadata'])
+    return chunk_files, done, metadata
+
+
+def write_chunk(frames, fingerprints, metadata, chunk_dir, part):
+    """Writes one partition of measurements and records it, with its entries' metadata, in the checkpoint."""
+    chunk_name = f"part-{part:05d}.csv"
+    chunk_path = os.path.join(chunk_dir, chunk_name)
+    pd.concat(frames, ignore_index=True).to_csv(chunk_path + ".tmp", index=False)
+    os.replace(chunk_path + ".tmp", chunk_path)
+    with open(os.path.join(chunk_dir, "checkpoint.jsonl"), "a", encoding="utf-8") as f:
+        f.write(json.dumps({'chunk': chunk_name, 'entries': fingerprints, 'metadata': metadata}) + "\n")
+    return chunk_path
+
+
+def compact_chunks(chunk_files, name, append=False, entry_ids=()):
+    """
+    Streams the chunk files (preceded by the existing raw dataset when append=True) into the
+    typed intermediate `name`, one batch at a time, aligning all of them to the union of their columns.
+    Existing rows of the chunks' entry_ids are replaced, so replaying a compaction after a crash
+    does not append the same entries twice.
+    """
+    append = append and intermediate_exists(name)
+    columns = intermediate_columns(name) if append else []
+    for chunk_file in chunk_files:
+        for col in pd.read_csv(chunk_file, nrows=0).columns:
+            if col not in columns:
+                columns.append(col)
+
+    entry_ids = set(map(str, entry_ids))
+
+    def batches():
+        if append:
+            for batch in iter_intermediate(name):
+                yield batch[~batch['id'].astype(str).isin(entry_ids)]
+        for chunk_file in chunk_files:
+            yield from pd.read_csv(chunk_file, chunksize=100_000)
+
+    with IntermediateWriter(name) as writer:
+        for batch in batches():
+            writer.write(batch.reindex(columns=columns))
+
+
+def save_entry_tables(metadata, append=False, extract_components=True):
+    """
+    Writes the entries table (one row per entry ID) and the reference table. Each distinct
+    ref is interned to an integer ref_id; with append=True the existing IDs are kept and
+    new entries and refs are added to the existing tables (rows of already stored entries are replaced). With extract_components=True the
+    entries' component IDs and the component registry used by steps 3-5 are written as well.
+    """
+    entries_df = pd.DataFrame(metadata)
+    refs_df = load_refs() if append and os.path.exists(REFS_FILE) else pd.DataFrame(columns=['ref_id', 'ref'])
+    ref_to_id = dict(zip(refs_df['ref'], refs_df['ref_id']))
+    new_refs = []
+    for ref in entries_df['ref']:
+        if ref not in ref_to_id:
+            ref_to_id[ref] = len(ref_to_id) + 1
+            new_refs.append({'ref_id': ref_to_id[ref], 'ref': ref})
+    entries_df['ref_id'] = entries_df['ref'].map(ref_to_id)
+    entries_df = entries_df[ENTRY_COLUMNS]
+
+    if append and os.path.exists(ENTRIES_FILE):
+        old_entries = load_entries()
+        old_entries = old_entries[~old_entries['id'].astype(str).isin(entries_df['id'].astype(str))]
+        entries_df = pd.concat([old_entries, entries_df], ignore_index=True)
+    entries_df.to_csv(ENTRIES_FILE, index=False)
+    pd.concat([refs_df, pd.DataFrame(new_refs, columns=['ref_id', 'ref'])], ignore_index=True).to_csv(REFS_FILE, index=False)
+
+    if extract_components:
+        register_components([record['components'] for record in metadata], append=append)
+    return entries_df
+
+
+def get_and_combine_data(search_params, name="step1_raw_activity_data", max_workers=None,
+                         rate_limit=DEFAULT_RATE_LIMIT, incremental=False, chunk_size=200, resume=True,
+                         extract_components=True):
+    """
+    Searches ILThermo, retrieves data (concurrently), combines, and saves it as the typed
+    intermediate `name` (see intermediate_store). Returns the path of the saved intermediate
+    (load it with load_intermediate(name)), or None if nothing was retrieved.
+    The measurement table only carries the entry 'id'; entry metadata (ref, phases, expmeth,
+    solvent, property) is saved once per entry to the entries and refs tables (see entry_tables).
+    max_workers bounds the number of in-flight requests and rate_limit the requests per second.
     Includes a progress bar and retries for robustness.
+
+    Processed entries are streamed to partitioned chunk files (chunk_size entries each) in
+    '<name>_chunks' as they complete, and a checkpoint records which IDs are stored. If a run
+    is interrupted, the next run resumes from the checkpoint (unless resume=False). The chunks are
+    compacted into the intermediate at the end, so memory use does not grow with the number of entries.
+    The chunks are removed only after the raw dataset, entry tables and manifest are written, and
+    replaying these writes replaces rather than duplicates the stored entries.
+
+    Every run records the harvested entry IDs with their row counts and content hashes in
+    '<name>_manifest.json'. With incremental=True, only entry IDs missing from that manifest
+    are fetched and their rows are appended to the existing raw dataset.
+
+    With extract_components=True the component details (IDs, names, formulas, SMILES, samples,
+    molecular weights) are captured in the same pass: each entry's component IDs go to the step1
+    components table and the details of every distinct component to the component registry, so
+    steps 3 and 4 can join them locally instead of fetching every entry again.
     """
     try:
         if not isinstance(search_params, dict):
@@ -77,31 +218,77 @@ def get_and_combine_data(search_params, filename="step1_raw_activity_data.csv",
             return
 
         entry_ids = [row['id'] for index, row in search_results.iterrows()]
-        num_entries = len(entry_ids)
 
-        all_data = []
+        manifest_path = manifest_path_for(name)
+        append = incremental and intermediate_exists(name)
+        manifest = {}
+        if append:
+            if os.path.exists(manifest_path):
+                manifest = load_manifest(manifest_path)
+            else:
+                manifest = rebuild_manifest(name)
+                save_manifest(manifest, manifest_path)
+                print(f"No manifest found for {name}: rebuilt it from the {len(manifest)} entry IDs of the raw dataset.")
+            removed_ids = set(manifest) - set(str(entry_id) for entry_id in entry_ids)
+            entry_ids = [entry_id for entry_id in entry_ids if str(entry_id) not in manifest]
+            print(f"Incremental mode: {len(manifest)} entries already harvested, {len(entry_ids)} new entries to fetch.")
+            if removed_ids:
+                print(f"Warning: {len(removed_ids)} previously harvested entries are no longer returned by the search and are kept as is.")
+            if not entry_ids:
+                print("Raw dataset is up to date.")
+                return stored_path(name)
+
+        chunk_dir = chunk_dir_for(name)
+        if not resume:
+            shutil.rmtree(chunk_dir, ignore_errors=True)
+        os.makedirs(chunk_dir, exist_ok=True)
+        chunk_files, done, metadata = load_checkpoint(chunk_dir)
+        if done:
+            entry_ids = [entry_id for entry_id in entry_ids if str(entry_id) not in done]
+            print(f"Resuming from checkpoint: {len(done)} entries already stored in {len(chunk_files)} chunks.")
+
         if max_workers is None:
-            max_workers = 1
-
-        with ProcessPoolExecutor(max_workers=max_workers) as executor:
-            futures = [executor.submit(process_entry, entry_id) for entry_id in entry_ids]
-
-            with tqdm(total=num_entries, desc="Processing Entries", unit="entry") as pbar:
-                for future in as_completed(futures):
-                    combined_df_entry = future.result()
-                    if combined_df_entry is not None:
-                        all_data.append(combined_df_entry)
-                    pbar.update(1)
-
-        if all_data:
-            combined_df = pd.concat(all_data, ignore_index=True)
-            print(f"Data retrieved and processed for {len(combined_df)} entries.")
-            
-            os.makedirs("Intermediate_Data", exist_ok=True)
-            combined_df.to_csv(os.path.join("Intermediate_Data", filename), index=False)
-            print(f"Data saved to {filename}")
-            print(combined_df[['id', 'ref', 'phases', 'expmeth', 'solvent', 'property', 'property_type']].head())
-            return combined_df
+            max_workers = DEFAULT_MAX_IN_FLIGHT
+
+        part = len(chunk_files)
+        frames, fingerprints, chunk_metadata = [], {}, []
+        for entry_id, result in fetch_entries(entry_ids, process_entry, max_in_flight=max_workers,
+                                              rate_limit=rate_limit, desc="Processing Entries"):
+            if result is not None:
+                entry_metadata, data_df = result
+                frames.append(data_df)
+                chunk_metadata.append(entry_metadata)
+                fingerprints[str(entry_id)] = entry_fingerprint(entry_metadata, data_df)
+            if len(frames) >= chunk_size:
+                chunk_files.append(write_chunk(frames, fingerprints, chunk_metadata, chunk_dir, part))
+                done.update(fingerprints)
+                metadata.extend(chunk_metadata)
+                part += 1
+                frames, fingerprints, chunk_metadata = [], {}, []
+        if frames:
+            chunk_files.append(write_chunk(frames, fingerprints, chunk_metadata, chunk_dir, part))
+            done.update(fingerprints)
+            metadata.extend(chunk_metadata)
+
+        if chunk_files:
+            num_rows = sum(record['rows'] for record in done.values())
+            print(f"Data retrieved and processed for {len(done)} entries ({num_rows} rows).")
+
+            compact_chunks(chunk_files, name, append=append, entry_ids=done)
+            entries_df = save_entry_tables(metadata, append=append, extract_components=extract_components)
+            manifest.update(done)
+            save_manifest(manifest, manifest_path)
+            shutil.rmtree(chunk_dir, ignore_errors=True)
+            if append:
+                print(f"{num_rows} new rows appended to {intermediate_path(name)}")
+            else:
+                print(f"Data saved to {intermediate_path(name)}")
+
+            print(f"Entry metadata saved to {ENTRIES_FILE} and {REFS_FILE}")
+            if extract_components:
+                print(f"Component IDs saved to {COMPONENTS_FILE} and component details to {REGISTRY_FILE}")
+            print(entries_df.head())
+            return stored_path(name)
         else:
             print("No data retrieved or processed.")
 
@@ -120,4 +307,4 @@ if __name__ == '__main__':
         # Additional parameters can be added here. Refer to ilthermopy.search.Search for more options.
     }
     
-    get_and_combine_data(search_params, max_workers=4)
+    get_and_combine_data(search_params, max_workers=4)  # pass incremental=True to only fetch entries added since the last run
@@ -1,68 +1,162 @@
 import pandas as pd
+import numpy as np
+from entry_tables import attach_metadata
+from intermediate_store import load_intermediate, save_intermediate
 
-def docode_data(df):
-    """Processes a DataFrame row by row, handling empty 'V4' values and 
-       assigning values to new columns based on conditions in V1, V2, and V3.
+# -------------------- Decoding Rules --------------------
+# One rule per ILThermo property, keyed by the entry's 'property' or by a ('property_type', 'property')
+# tuple (tuple keys take precedence). For every rule:
+#   target: name of the measured quantity, read from target_column
+#   fill_target_from: column moved into target_column where the latter is empty (entries without a
+#                     mole fraction column store the measured value one column earlier)
+#   quantities: experimental conditions classified from condition_columns; later columns take precedence
+#   filters: conditions a decoded row has to satisfy to be retained
+#   excluded_solvents: solvents whose entries are removed before decoding
+# Conditions are ('between', low, high) (inclusive), ('>', x), ('>=', x), ('<', x) or ('<=', x).
+DECODING_RULES = {
+    'Activity coefficient': {  # prop_key 'BPpY'
+        'target': 'gamma',
+        'target_column': 'V4',
+        'fill_target_from': 'V3',
+        'condition_columns': ['V1', 'V2', 'V3'],
+        'quantities': {
+            'temperature': ('>', 250),              # K
+            'pressure': ('between', 98, 102),       # kPa. To maintain constant pressure for all samples (additionally, a very small portion of samples are removed).
+            'mole_fraction': ('<', 5),
+        },
+        'filters': [('mole_fraction', '<', 1e-5)],  # Retain rows with a mole fraction less than 1e-5 to be considered as infinite dilution. Remove this filter if it is not needed based on your goal.
+        'excluded_solvents': ['water', 'methanol', 'ethanol', 'propan-1-ol'],  # check for other solvents as needed
+    },
+}
+
+
+def condition_mask(values, condition):
+    op = condition[0]
+    if op == 'between':
+        return values.between(condition[1], condition[2], inclusive='both')
+    if op == '>':
+        return values > condition[1]
+    if op == '>=':
+        return values >= condition[1]
+    if op == '<':
+        return values < condition[1]
+    if op == '<=':
+        return values <= condition[1]
+    raise ValueError(f"Unknown condition operator: {op}")
+
+
+def match_rules(df, rules, default_rule=None):
+    """
+    Returns a list of (rule, row mask) pairs assigning every row to at most one decoding rule.
+    Raises ValueError when no row has a decoding rule (step2 would otherwise output nothing).
+    """
+    unmatched = pd.Series(True, index=df.index)
+    matches = []
+    for key in sorted(rules, key=lambda k: not isinstance(k, tuple)):  # tuple keys first
+        if isinstance(key, tuple):
+            mask = (df['property_type'] == key[0]) & (df['property'] == key[1])
+        else:
+            mask = df['property'] == key
+        mask &= unmatched
+        if mask.any():
+            matches.append((rules[key], mask))
+            unmatched &= ~mask
+    if unmatched.any():
+        unknown = sorted(df.loc[unmatched, 'property'].dropna().astype(str).unique())
+        if default_rule is not None:
+            print(f"No decoding rule for {unknown or 'missing property'}; {unmatched.sum()} rows decoded with the '{default_rule}' rule.")
+            matches.append((rules[default_rule], unmatched))
+        elif not matches:
+            raise ValueError(f"No decoding rule for any row (properties: {unknown or 'missing'}). "
+                             f"Add a rule to DECODING_RULES or pass default_rule.")
+        else:
+            print(f"No decoding rule for {unknown or 'missing property'}; {unmatched.sum()} rows removed.")
+    return matches
+
+
+def apply_rule(df, rule):
+    """Decodes all rows of one property with whole-column masked operations."""
+    df = df[~df['solvent'].str.lower().isin(rule['excluded_solvents'])].copy()
+
+    # Initialize new columns
+    for quantity in rule['quantities']:
+        df[quantity] = np.nan
+
+    # Shift the measured value into the target column for all rows where it is empty
+    target_column, source_column = rule['target_column'], rule.get('fill_target_from')
+    if source_column:
+        shift = df[target_column].isna()
+        df[target_column] = df[target_column].where(~shift, df[source_column])
+        df[source_column] = df[source_column].where(~shift)
+
+    # Create the target column
+    df[rule['target']] = df[target_column]
+
+    # Assign values based on conditions in the condition columns (later columns take precedence)
+    for col in rule['condition_columns']:
+        values = df[col]
+        for quantity, condition in rule['quantities'].items():
+            df[quantity] = values.where(condition_mask(values, condition), df[quantity])
+
+    # Sanity check
+    sum_original = df[rule['condition_columns'] + [target_column]].sum(axis=1, skipna=True)
+    sum_new = df[list(rule['quantities']) + [rule['target']]].sum(axis=1, skipna=True)
+    df['sanity_check'] = (sum_original - sum_new).abs() < 1e-6
+    return df
+
+
+def docode_data(df, rules=DECODING_RULES, default_rule=None, save=True):
+    """Decodes the V-columns of a (possibly mixed-property) raw DataFrame into physical quantities.
+
+    Rows are matched to a decoding rule by their entry's property (see DECODING_RULES) and every
+    rule is applied with whole-column masked operations, so several properties are decoded in one run.
 
     Args:
         df: The Pandas DataFrame to process.
+        rules: Decoding rules keyed by property or (property_type, property).
+        default_rule: Rule used for rows whose property has no rule (e.g. 'Activity coefficient'); the
+            default None removes such rows.
+        save: Whether to write the adjusted data (and failed sanity check rows) to Intermediate_Data.
 
     Returns:
         A copy of the processed Pandas DataFrame.
+
+    Raises:
+        ValueError: If no row matches a decoding rule and no default_rule is given.
     """
-    df_copy = df.copy()
+    df_copy = attach_metadata(df, ['solvent', 'property', 'property_type'])  # entry metadata lives in the step1 entries table
     df_copy['original_index'] = df_copy.index  # Store original index
-    # remove rows with 'solvent' column water, methanol, ethanol, propan-1-ol
-    df_copy = df_copy[~df_copy['solvent'].str.lower().isin(['water', 'methanol', 'ethanol', 'propan-1-ol'])] # check for other solvents as needed or remove this line if not needed
-    
-
-    # Initialize new columns
-    df_copy['temperature'] = None
-    df_copy['pressure'] = None
-    df_copy['mole_fraction'] = None
+    matches = match_rules(df_copy, rules, default_rule)  # raises when no row can be decoded
 
     try:
-        for index, row in df_copy.iterrows():
-            if pd.isna(row['V4']):
-                df_copy.loc[index, 'temp_gamma'] = row['V3']
-                df_copy.loc[index, 'V4'] = df_copy.loc[index, 'temp_gamma']
-                df_copy.loc[index, 'V3'] = None
-
-        # Create gamma column from V4
-        df_copy['gamma'] = df_copy['V4']
-
-        df_copy = df_copy.drop(columns=['temp_gamma'], errors='ignore')
-
-        # Assign values based on conditions in V1, V2, V3 (outside the row loop)
-        for col in ['V1', 'V2', 'V3']:
-            df_copy.loc[df_copy[col].between(98, 102, inclusive='both'), 'pressure'] = df_copy[col]  #To maintain constant pressure for all samples (additionally, a very small portion of samples are removed).
-            df_copy.loc[df_copy[col] > 250, 'temperature'] = df_copy[col]
-            df_copy.loc[df_copy[col] < 5, 'mole_fraction'] = df_copy[col]
-
-        # Sanity check
-        df_copy['sum_original'] = df_copy[['V1', 'V2', 'V3', 'V4']].sum(axis=1, skipna=True)
-        df_copy['sum_new'] = df_copy[['pressure', 'temperature', 'mole_fraction', 'gamma']].sum(axis=1, skipna=True)
-        df_copy['sanity_check'] = (df_copy['sum_original'] - df_copy['sum_new']).abs() < 1e-6
-        
+        decoded, failed = [], []
+        for rule, mask in matches:
+            rule_df = apply_rule(df_copy[mask], rule)
+            failed.append(rule_df[~rule_df['sanity_check']])
+            rule_df = rule_df[rule_df['sanity_check']]
+            for quantity, *condition in rule.get('filters', []):
+                rule_df = rule_df[condition_mask(rule_df[quantity], condition)]
+            decoded.append(rule_df)
+
         # Report rows that fail the sanity check
-        failed_sanity_check = df_copy[~df_copy['sanity_check']]
+        failed_sanity_check = pd.concat(failed) if failed else pd.DataFrame()
         if not failed_sanity_check.empty:
-            failed_sanity_check.to_csv('Intermediate_Data/step2_sanity_check_failed_rows_for_column_adjusment.csv', index=False)
+            if save:
+                failed_sanity_check.sort_values(by='original_index').to_csv('Intermediate_Data/step2_sanity_check_failed_rows_for_column_adjusment.csv', index=False)
             print("Some rows failed the sanity check due to significant discrepancies in experimental parameters, such as pressure, compared to the rest of the samples. Consequently they have been removed. Check 'step2_sanity_check_failed_rows.csv'.")
             print(f"Number of failed rows: {failed_sanity_check.shape[0]}")
-        
-        df_copy = df_copy.sort_values(by='original_index').drop(columns=['original_index', 'sum_original', 'sum_new'])
-        df_copy = df_copy[df_copy['sanity_check']]
-        df_copy = df_copy.drop(columns=['sanity_check'])
-        df_copy = df_copy[df_copy['mole_fraction'] < 1e-5]  # Retain rows with a mole fraction less than 1e-5 to be considered as infinite dilution. Remove this line if it is not needed based on your goal.
+
+        df_copy = pd.concat(decoded) if decoded else df_copy.iloc[0:0]
+        df_copy = df_copy.sort_values(by='original_index').drop(columns=['original_index', 'sanity_check'], errors='ignore')
         print(f"Processed DataFrame shape: {df_copy.shape}")
         # Save to CSV
-        df_copy.to_csv('Intermediate_Data/step2_columns_adjusted.csv', index=False)
+        if save:
+            save_intermediate(df_copy, 'step2_columns_adjusted')
         return df_copy
 
 
-    except KeyError:
-        print("Error: Columns 'V1', 'V2', 'V3', or 'V4' not found in DataFrame.")
+    except KeyError as e:
+        print(f"Error: Column {e} not found in DataFrame.")
         return df.copy()
     except Exception as e:
         print(f"An unexpected error occurred: {e}")        
@@ -70,6 +164,6 @@ def docode_data(df):
 
 if __name__ == "__main__":
     
-    raw_data = pd.read_csv('Intermediate_Data/step1_raw_activity_data.csv')
+    raw_data = load_intermediate('step1_raw_activity_data')
     adjusted_data = docode_data(raw_data)
 
@@ -1,49 +1,32 @@
-import ilthermopy as ilt
 import pandas as pd
 import time
-from concurrent.futures import ProcessPoolExecutor
-from tqdm import tqdm
+from fetch_engine import fetch_entries
+from entry_tables import KEY_COLUMNS, component_record, load_links, register_components
+from intermediate_store import load_intermediate, save_intermediate
 
-# -------------------- Function to Fetch Data --------------------
-def fetch_entry_data(idx):
-    """Fetch ILThermo entry data and extract component details."""
-    try:
-        entry = ilt.GetEntry(idx)
-        cmp1, cmp2 = entry.components[0], entry.components[1]
-        return [
-            idx,  # Keep ID for merging
-            cmp1.id, cmp1.name, cmp1.formula, cmp1.smiles, cmp1.smiles_error, cmp1.sample, cmp1.mw,
-            cmp2.id, cmp2.name, cmp2.formula, cmp2.smiles, cmp2.smiles_error, cmp2.sample, cmp2.mw
-        ]
-    except Exception:
-        return [idx] + [None] * 13  # Fill missing values with None in case of error
-
-# -------------------- Function to Process a Batch --------------------
-def process_batch(batch):
-    """Process a batch of IDs by fetching their ILThermo data."""
-    return [fetch_entry_data(i) for i in batch]
+# -------------------- Function to Extract Component Data --------------------
+def fetch_entry_data(idx, entry):
+    """Extract component details from a fetched ILThermo entry (ID is kept for merging)."""
+    return component_record(idx, entry)
 
 # -------------------- Function to Process Unique IDs --------------------
-def fetch_unique_data(unique_ids, batch_size=50, num_workers=10):
-    """Fetch only unique data in batches to prevent redundant requests."""
+def fetch_unique_data(unique_ids, num_workers=10):
+    """Fetch only unique data concurrently to prevent redundant requests (failed entries are left out)."""
     results = []
-    batches = [unique_ids[i:i+batch_size] for i in range(0, len(unique_ids), batch_size)]  # Create batches
-
-    with ProcessPoolExecutor(max_workers=num_workers) as executor:
-        futures = {executor.submit(process_batch, batch): batch for batch in batches}
-        for future in tqdm(futures, total=len(batches), desc="Fetching unique ILThermo data"):
-            results.extend(future.result())  # Extend list with results
-
+    for idx, row in fetch_entries(unique_ids, fetch_entry_data, max_in_flight=num_workers,
+                                  desc="Fetching unique ILThermo data"):
+        if row is not None:
+            results.append(row)
     return results
 
 # -------------------- Function to Save Data --------------------
-def save_to_csv(df, filename="step3_smiles_added.csv"):
-    """Save DataFrame to CSV file."""
-    df.to_csv(f"Intermediate_Data/{filename}", index=False)
-    print(f"✅ Data extraction complete! Saved as '{filename}'")
+def save_data(df, name="step3_smiles_added"):
+    """Save DataFrame as a typed intermediate."""
+    path = save_intermediate(df, name)
+    print(f"✅ Data extraction complete! Saved as '{path}'")
 
 # -------------------- Main Function --------------------
-def get_smiles(df):
+def get_smiles(df, save=True):
 
     # Extract unique IDs
     unique_ids = df["id"].unique().tolist()
@@ -51,21 +34,23 @@ def get_smiles(df):
     # Start time tracking
     start_time = time.time()
 
-    # Fetch only unique ID data
-    unique_results = fetch_unique_data(unique_ids)
-
-    # Convert to DataFrame
-    columns = [
-        "id", "cmp1_id", "cmp1_name", "cmp1_formula", "cmp1_smiles", "cmp1_smiles_error", "cmp1_sample", "cmp1_mw",
-        "cmp2_id", "cmp2_name", "cmp2_formula", "cmp2_smiles", "cmp2_smiles_error", "cmp2_sample", "cmp2_mw"
-    ]
-    unique_df = pd.DataFrame(unique_results, columns=columns)
+    # Component IDs harvested by step1 are joined locally; only entries missing there are fetched
+    # and their components are added to the component registry
+    local_ids = set(load_links(unique_ids)["id"])
+    missing_ids = [i for i in unique_ids if str(i) not in local_ids]
+    print(f"{len(unique_ids) - len(missing_ids)} entries found in the step1 component table, {len(missing_ids)} to fetch.")
+    if missing_ids:
+        new_components = register_components(fetch_unique_data(missing_ids))
+        print(f"{new_components} new components added to the component registry.")
+    links = load_links(unique_ids)[["id"] + KEY_COLUMNS]
+    links["id"] = links["id"].astype(df["id"].dtype)
 
-    # Merge with full dataset (ensuring all rows get their respective component data)
-    df = df.merge(unique_df, on="id", how="left")
+    # Merge with full dataset: every row carries the IDs of its two components
+    df = df.merge(links, on="id", how="left")
 
     # Save updated dataset
-    save_to_csv(df)
+    if save:
+        save_data(df)
 
     # Print execution time
     print(f"⏳ Execution Time: {time.time() - start_time:.2f} seconds")
@@ -74,6 +59,5 @@ def get_smiles(df):
 # -------------------- Run the Script --------------------
 if __name__ == "__main__":
     # Load dataset
-    file_path = "Intermediate_Data/step2_columns_adjusted.csv"
-    df = pd.read_csv(file_path)
+    df = load_intermediate("step2_columns_adjusted")
     get_smiles(df)
@@ -1,59 +1,74 @@
 import pandas as pd
-import ilthermopy as ilt
-from tqdm import tqdm
+from fetch_engine import fetch_entries, DEFAULT_MAX_IN_FLIGHT
+from entry_tables import KEY_COLUMNS, attach_components, component_record, load_links, register_components
+from intermediate_store import load_intermediate, save_intermediate
 
-def read_data(file_path):
-    return pd.read_csv(file_path)
+def read_data(name):
+    return load_intermediate(name)
 
-def filter_nan_rows(df):
-    nan_rows = df[df['cmp1_smiles'].isna() | df['cmp2_smiles'].isna()]
-    nan_rows.to_csv('Intermediate_Data/step4_missing_smiles_rows.csv', index=False)
+def filter_nan_rows(df, save=True):
+    smiles = attach_components(df[['id'] + KEY_COLUMNS], ['smiles'])
+    nan_rows = df[smiles['cmp1_smiles'].isna() | smiles['cmp2_smiles'].isna()]
+    if save:
+        attach_components(nan_rows, ['name', 'smiles']).to_csv('Intermediate_Data/step4_missing_smiles_rows.csv', index=False)
     return nan_rows['id'].unique()
 
-def fetch_entry_data(nan_rows_id):
-    entry_data = []
-    for id in tqdm(nan_rows_id, desc="Fetching ILThermo Data", unit="id"):
-        entry = ilt.GetEntry(id)
-        cmp1 = entry.components[0]
-        cmp2 = entry.components[1]
-        entry_data.append([
-            id, 
-            cmp1.id, cmp1.name, cmp1.formula, cmp1.smiles, cmp1.smiles_error, cmp1.sample, cmp1.mw,
-            cmp2.id, cmp2.name, cmp2.formula, cmp2.smiles, cmp2.smiles_error, cmp2.sample, cmp2.mw
-        ])
-    return entry_data
-
-def create_smiles_resolved_df(entry_data):
-    columns = [
-        "id", "cmp1_id", "cmp1_name", "cmp1_formula", "cmp1_smiles", "cmp1_smiles_error", "cmp1_sample", "cmp1_mw",
-        "cmp2_id", "cmp2_name", "cmp2_formula", "cmp2_smiles", "cmp2_smiles_error", "cmp2_sample", "cmp2_mw"
-    ]
-    return pd.DataFrame(entry_data, columns=columns)
+def fetch_entry_data(nan_rows_id, num_workers=DEFAULT_MAX_IN_FLIGHT, max_retries=3, timeout=10, retry_passes=1):
+    """
+    Fetch the components of the entries in nan_rows_id concurrently. Entries that still fail after
+    max_retries are skipped and retried once more per retry pass; returns (records, failed IDs).
+    """
+    # Entries harvested by step1 are already in the component registry; only the rest is fetched
+    local_ids = set(load_links(nan_rows_id)['id'])
+    pending = [i for i in nan_rows_id if str(i) not in local_ids]
+    entry_data, failed = [], []
+    for attempt in range(1 + retry_passes):
+        failed = []
+        for id, record in fetch_entries(pending, component_record, max_in_flight=num_workers, max_retries=max_retries,
+                                        timeout=timeout, desc="Fetching ILThermo Data" if attempt == 0 else "Retrying failed IDs"):
+            if record is None:
+                failed.append(id)
+            else:
+                entry_data.append(record)
+        if not failed:
+            break
+        print(f"{len(failed)} entries could not be fetched (pass {attempt + 1}/{1 + retry_passes}).")
+        pending = failed
+    return entry_data, failed
+
+def report_failed_ids(failed, passes, save=True):
+    if not failed:
+        return
+    print(f"Missing SMILES of {len(failed)} entries could not be backfilled. Check 'step4_backfill_failed_ids.csv'.")
+    if save:
+        pd.DataFrame({'id': failed, 'passes': passes}).to_csv('Intermediate_Data/step4_backfill_failed_ids.csv', index=False)
+
+def create_smiles_resolved_df(entry_data, nan_rows_id):
+    register_components(entry_data)
+    return load_links(nan_rows_id)[['id'] + KEY_COLUMNS]
 
 def merge_and_fill_data(df, smiles_resolved):
-    missing_columns = [
-        "cmp1_id", "cmp1_name", "cmp1_formula", "cmp1_smiles", "cmp1_smiles_error", "cmp1_sample", "cmp1_mw",
-        "cmp2_id", "cmp2_name", "cmp2_formula", "cmp2_smiles", "cmp2_smiles_error", "cmp2_sample", "cmp2_mw"
-    ]
+    smiles_resolved = smiles_resolved.astype({'id': df['id'].dtype})
     df_filled = df.merge(smiles_resolved, on='id', how='left', suffixes=('', '_resolved'))
-    for column in missing_columns:
+    for column in KEY_COLUMNS:
         if column + '_resolved' in df_filled.columns:
-            df_filled[column] = df_filled[column].fillna(df_filled[column + '_resolved'])
+            df_filled[column] = df_filled[column].astype(object).where(df_filled[column].notna(), df_filled[column + '_resolved'])
     df_filled.drop(columns=[col for col in df_filled if col.endswith('_resolved')], inplace=True)
     return df_filled
 
-def save_data(df, file_path):
-    df.to_csv(file_path, index=False)
+def save_data(df, name):
+    save_intermediate(df, name)
 
-def missing_smiles(df):
-    nan_rows_id = filter_nan_rows(df)
-    entry_data = fetch_entry_data(nan_rows_id)
-    smiles_resolved = create_smiles_resolved_df(entry_data)
+def missing_smiles(df, save=True, retry_passes=1):
+    nan_rows_id = filter_nan_rows(df, save=save)
+    entry_data, failed = fetch_entry_data(nan_rows_id, retry_passes=retry_passes)
+    report_failed_ids(failed, 1 + retry_passes, save=save)
+    smiles_resolved = create_smiles_resolved_df(entry_data, nan_rows_id)
     df_filled = merge_and_fill_data(df, smiles_resolved)
-    save_data(df_filled, 'Intermediate_Data/step4_missing_smiles_added.csv')
+    if save:
+        save_data(df_filled, 'step4_missing_smiles_added')
     return df_filled
 
 if __name__ == "__main__":
-    file_path = 'Intermediate_Data/step3_smiles_added.csv'
-    df = read_data(file_path)
+    df = read_data('step3_smiles_added')
     missing_smiles(df)
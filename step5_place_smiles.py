@@ -1,45 +1,61 @@
 import pandas as pd
+import numpy as np
+from entry_tables import attach_components
+from molecule_cache import MoleculeCache
+from intermediate_store import load_intermediate, save_intermediate
 
-def load_dataset(file_path):
-    return pd.read_csv(file_path)
+def load_dataset(name):
+    return load_intermediate(name)
+
+ROLE_COLUMNS = ['SMILES_IL', 'SMILES_solute', 'IL_name', 'solute_name', 'IL_id', 'solute_id']
 
 def initialize_columns(df):
-    columns_to_add = ['SMILES_IL', 'SMILES_solute', 'IL_name', 'solute_name', 'IL_id', 'solute_id']
+    columns_to_add = ROLE_COLUMNS
     for column in columns_to_add:
         df[column] = 'NaN'
     return df
 
-def is_ionic_liquid(smiles):
-    return isinstance(smiles, str) and ("." in smiles and "+" in smiles and "-")
+def ionic_liquid_flags(facts):
+    """An IL has more than one fragment and a positively charged atom."""
+    return (facts['fragments'] > 1) & (facts['positive_charge'] > 0)
+
+def is_dicationic(smiles):
+    """String test on the SMILES as written: '-' bond characters and '.' separators count as well."""
+    return isinstance(smiles, str) and (smiles.count('+') > 1 or smiles.count('-') > 1 or smiles.count('.') > 1)
+
+def lookup_flags(values, flags):
+    """Broadcast per-SMILES flags to values through its unique strings (missing SMILES are False)."""
+    codes, uniques = pd.factorize(values.to_numpy(dtype=object), use_na_sentinel=False)
+    return flags.reindex(uniques).fillna(False).to_numpy(dtype=bool)[codes] if len(uniques) else np.zeros(0, dtype=bool)
 
-def assign_smiles_and_ids(df):
-    for index, row in df.iterrows():
-        smiles_1, smiles_2 = row['cmp1_smiles'], row['cmp2_smiles']
-        name_1, name_2 = row['cmp1_name'], row['cmp2_name']
-        id_1, id_2 = row['cmp1_id'], row['cmp2_id']
+def pair_roles(smiles_1, smiles_2, cache):
+    """
+    Returns 1 where the first component is the IL, 2 where the second one is and 0 otherwise.
+    The IL check runs once per unique SMILES on the molecule cache facts and the role of every
+    (cmp1_smiles, cmp2_smiles) pair is broadcast back to its rows with array lookups.
+    """
+    is_il = ionic_liquid_flags(cache.facts(pd.concat([smiles_1, smiles_2])))
+    first = lookup_flags(smiles_1, is_il)
+    second = ~first & lookup_flags(smiles_2, is_il)
+    return np.where(first, 1, np.where(second, 2, 0)).astype(np.int8)
 
-        if is_ionic_liquid(smiles_1):
-            df.at[index, 'SMILES_IL'] = smiles_1
-            df.at[index, 'IL_name'] = name_1
-            df.at[index, 'IL_id'] = id_1
-            df.at[index, 'SMILES_solute'] = smiles_2
-            df.at[index, 'solute_name'] = name_2
-            df.at[index, 'solute_id'] = id_2
-        elif is_ionic_liquid(smiles_2):
-            df.at[index, 'SMILES_IL'] = smiles_2
-            df.at[index, 'IL_name'] = name_2
-            df.at[index, 'IL_id'] = id_2
-            df.at[index, 'SMILES_solute'] = smiles_1
-            df.at[index, 'solute_name'] = name_1
-            df.at[index, 'solute_id'] = id_1
+def assign_smiles_and_ids(df, cache=None):
+    role = pair_roles(df['cmp1_smiles'], df['cmp2_smiles'], cache or MoleculeCache())
+    first, second = role == 1, role == 2
+    for target, field in [('SMILES_IL', 'smiles'), ('IL_name', 'name'), ('IL_id', 'id')]:
+        values_1, values_2 = df[f'cmp1_{field}'].astype(object), df[f'cmp2_{field}'].astype(object)
+        df[target] = values_1.where(first, values_2.where(second, df[target])).astype(df[target].dtype)
+    for target, field in [('SMILES_solute', 'smiles'), ('solute_name', 'name'), ('solute_id', 'id')]:
+        values_1, values_2 = df[f'cmp1_{field}'].astype(object), df[f'cmp2_{field}'].astype(object)
+        df[target] = values_2.where(first, values_1.where(second, df[target])).astype(df[target].dtype)
     return df
 
 def filter_dicationic_compounds(df):
-    def is_dicationic(smiles):
-        return smiles.count('+') > 1 or smiles.count('-') > 1 or smiles.count('.') > 1
-
-    dicationic_df = df[df['SMILES_IL'].apply(is_dicationic)]
-    df = df[~df['SMILES_IL'].apply(is_dicationic)]
+    # Checked once per unique IL SMILES
+    codes, uniques = pd.factorize(df['SMILES_IL'], use_na_sentinel=False)
+    dicationic = np.array([is_dicationic(smiles) for smiles in uniques], dtype=bool)[codes] if len(uniques) else np.zeros(0, dtype=bool)
+    dicationic_df = df[dicationic]
+    df = df[~dicationic]
     return df, dicationic_df
 
 def sanity_check(df):
@@ -51,9 +67,8 @@ def sanity_check(df):
     else:
         print("All SMILES have been assigned.")
 
-def save_dataset(df, output_file):
-    output_file = "Intermediate_Data/" + output_file
-    df.to_csv(output_file, index=False)
+def save_dataset(df, name):
+    output_file = save_intermediate(df, name)
     print(f"Processing complete. Updated file saved as {output_file}.")
 
 def save_removed_rows(df, output_file):
@@ -61,18 +76,26 @@ def save_removed_rows(df, output_file):
     df.to_csv(output_file, index=False)
     print(f"Removed rows saved as {output_file}.")
 
-def place_smiles(df):   
-    output_file = "step5_place_smiles_for_IL_and_solute.csv"
+def place_smiles(df, save=True):
+    output_file = "step5_place_smiles_for_IL_and_solute"
     removed_rows_file = "step5_removed_dicationic_rows.csv"
+    # Component names and SMILES are looked up in the registry through the rows' component IDs
+    detail_columns = ['cmp1_name', 'cmp1_smiles', 'cmp2_name', 'cmp2_smiles']
+    df = attach_components(df, ['name', 'smiles'])
+    cache = MoleculeCache()  # charges and fragment counts of every SMILES are parsed once (IL check)
     df = initialize_columns(df)
-    df = assign_smiles_and_ids(df)
+    df = assign_smiles_and_ids(df, cache)
+    df = df.drop(columns=detail_columns)
     df, removed_rows_df = filter_dicationic_compounds(df)
     sanity_check(df)
-    save_dataset(df, output_file)
-    save_removed_rows(removed_rows_df, removed_rows_file)
+    # Unassigned roles become missing values (as the CSV hand-off used to read them back)
+    df = df.assign(**{column: df[column].replace('NaN', np.nan) for column in ROLE_COLUMNS})
+    if save:
+        cache.save()
+        save_dataset(df, output_file)
+        save_removed_rows(removed_rows_df, removed_rows_file)
     return df
 
 if __name__ == "__main__":
-    file_path = "Intermediate_Data/step4_missing_smiles_added.csv"
-    df = load_dataset(file_path)
+    df = load_dataset("step4_missing_smiles_added")
     place_smiles(df)
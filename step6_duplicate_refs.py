@@ -1,60 +1,83 @@
 import os
 import pandas as pd
-import re
+from entry_tables import attach_metadata, lookup_refs
+from ref_index import RefIndex
+from intermediate_store import load_intermediate, save_intermediate
 
-def load_csv(file_path):
-    return pd.read_csv(file_path, dtype=str)
+def load_data(name):
+    return load_intermediate(name)
 
 def ensure_column_exists(df, column_name):
     if column_name not in df.columns:
         raise KeyError(f"The CSV file must contain a '{column_name}' column.")
 
-def extract_title(ref_text):
-    match = re.search(r"'title':\s*'([^']+)'|\"title\":\s*\"([^\"]+)\"", str(ref_text))
-    return match.group(1) if match and match.group(1) else match.group(2) if match else None
-
 def get_unique_refs(df):
-    unique_refs = df[['ref']].drop_duplicates().copy()
-    unique_refs['title'] = unique_refs['ref'].apply(extract_title)
+    # refs are looked up once per ref_id, in order of first appearance in the dataset
+    unique_refs = df[['ref_id']].drop_duplicates().copy()
+    unique_refs['ref'] = lookup_refs(unique_refs['ref_id']).values
     return unique_refs
 
-def find_duplicate_titles(unique_refs):
-    duplicate_titles = unique_refs[unique_refs.duplicated('title', keep=False)]
-    refs_to_remove = duplicate_titles.duplicated('title', keep='first')
-    return duplicate_titles.reset_index(drop=True), refs_to_remove.reset_index(drop=True)
+def find_duplicate_refs(unique_refs, index):
+    """Groups refs by duplicate cluster; within a cluster the ref appearing first in the dataset is kept."""
+    unique_refs = unique_refs.copy()
+    unique_refs['cluster'] = index.clusters(unique_refs['ref']).values
+    duplicates = unique_refs[unique_refs.duplicated('cluster', keep=False)].copy()
+    duplicates['duplicate_of'] = duplicates.groupby('cluster', sort=False)['ref_id'].transform('first')
+    refs_to_remove = duplicates.duplicated('cluster', keep='first')
+    return duplicates.reset_index(drop=True), refs_to_remove.reset_index(drop=True)
+
+def find_suspected_refs(unique_refs, index):
+    """Refs with a near-identical title but another citation (year, first author, source) than a kept ref; reported, not removed."""
+    unique_refs = unique_refs.copy()
+    unique_refs['cluster'] = index.clusters(unique_refs['ref']).values
+    unique_refs['near_of'] = index.suspected(unique_refs['ref']).values
+    first_refs = unique_refs.drop_duplicates('cluster').set_index('cluster')['ref_id']
+    suspected = unique_refs[unique_refs['near_of'].notna()].copy()
+    suspected['duplicate_of'] = suspected['near_of'].map(first_refs)
+    return suspected[['ref_id', 'ref', 'duplicate_of']].reset_index(drop=True)
 
 def remove_duplicate_refs(df, removed_refs):
-    return df[~df['ref'].isin(removed_refs)]
+    return df[~df['ref_id'].isin(removed_refs['ref_id'])]
 
 def save_to_csv(df, file_path):
     df.to_csv(file_path, index=False)
 
-def duplicate_refs(df):
+def duplicate_refs(df, save=True):
 
-    ensure_column_exists(df, 'ref')
+    ensure_column_exists(df, 'id')
+    df = attach_metadata(df, ['ref_id'])  # ref_id comes from the step1 entries table
     
+    # Duplicates share a normalized title, a DOI or a near-identical title with the same citation (see ref_index)
+    index = RefIndex()
     unique_refs = get_unique_refs(df)
-    duplicate_titles, refs_to_remove = find_duplicate_titles(unique_refs)
-    
-    removed_refs = duplicate_titles[refs_to_remove]['ref']
-    removed_rows = df[df['ref'].isin(removed_refs)]
+    duplicates, refs_to_remove = find_duplicate_refs(unique_refs, index)
+
+    removed_refs = duplicates[refs_to_remove][['ref_id', 'ref', 'duplicate_of']]
+    removed_rows = df[df['ref_id'].isin(removed_refs['ref_id'])]
     df_filtered = remove_duplicate_refs(df, removed_refs)
-    intermediate_dir = os.path.join(os.getcwd(), 'Intermediate_Data')
-    removed_rows_file = os.path.join(intermediate_dir, 'step6_removed_rows_for_duplicate_refs.csv')
-    removed_refs_file = os.path.join(intermediate_dir, 'step6_removed_refs_for_duplicate_refs.csv')
-    output_file = os.path.join(intermediate_dir, 'step6_activity_data_removed_duplicate_refs.csv')
-    
-    save_to_csv(removed_rows, removed_rows_file)
-    save_to_csv(removed_refs, removed_refs_file)
-    save_to_csv(df_filtered, output_file)
-    
     print(f"Total rows removed: {len(removed_rows)}")
-    print(f"Removed rows saved to: {removed_rows_file}")
-    print(f"Removed references saved to: {removed_refs_file}")
-    print(f"Updated dataset saved to: {output_file}")
+
+    # Near-identical titles with another citation (e.g. papers of one series) are listed with removed=False and kept
+    suspected_refs = find_suspected_refs(unique_refs, index)
+    if len(suspected_refs):
+        print(f"{len(suspected_refs)} refs with a near-duplicate title but another citation kept.")
+    removed_refs = pd.concat([removed_refs.assign(removed=True), suspected_refs.assign(removed=False)],
+                             ignore_index=True)
+    if save:
+        intermediate_dir = os.path.join(os.getcwd(), 'Intermediate_Data')
+        removed_rows_file = os.path.join(intermediate_dir, 'step6_removed_rows_for_duplicate_refs.csv')
+        removed_refs_file = os.path.join(intermediate_dir, 'step6_removed_refs_for_duplicate_refs.csv')
+
+        index.save()
+        save_to_csv(removed_rows, removed_rows_file)
+        save_to_csv(removed_refs, removed_refs_file)
+        output_file = save_intermediate(df_filtered, 'step6_activity_data_removed_duplicate_refs')
+
+        print(f"Removed rows saved to: {removed_rows_file}")
+        print(f"Removed references saved to: {removed_refs_file}")
+        print(f"Updated dataset saved to: {output_file}")
     return df_filtered
 
 if __name__ == "__main__":
-    file_path = 'Intermediate_Data/step5_place_smiles_for_IL_and_solute.csv'
-    df = load_csv(file_path)
+    df = load_data('step5_place_smiles_for_IL_and_solute')
     duplicate_refs(df)
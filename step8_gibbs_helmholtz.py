@@ -4,147 +4,87 @@ import pandas as pd
 import numpy as np
 import seaborn as sns
 import matplotlib.pyplot as plt
-from scipy.stats import linregress, ttest_ind, t
+from scipy.stats import ttest_ind
+from gh_regression import gibbs_helmholtz_regression
+from intermediate_store import load_intermediate, save_intermediate
 
+threshold = 5  # minimum number of data points of an IL/solute combination
+REGRESSION_COLUMNS = ['intercept', 'slope', 'r_squared', 't_p_value', 'rsd', 'normalized_mae']
 
 
-def gibbs_helmholtz_coefficients(df, target = 'gamma'):
-    """
-    Processes the input DataFrame, filters out combinations with fewer than threshold occurrences, 
-    ranks combinations by population, and creates new DataFrames with 'ref_id' values 
-    for each combination.
+def combination_codes(df):
+    """Returns the group code of every row (combinations numbered by first appearance) and the population of each group."""
+    codes = df.groupby(['IL_id', 'solute_id'], sort=False).ngroup().fillna(-1).to_numpy(np.int64)  # -1: missing key
+    return codes, np.bincount(codes[codes >= 0], minlength=codes.max() + 1 if len(codes) else 0)
 
-    Args:
-        df: The input DataFrame.
-        target: The name of the target column for analysis.
 
-    Returns:
-        A tuple containing:
-            - gh_df: A DataFrame containing the ranked combinations and slope and intercept of Gibbs-Helmholtz equation.
-            - multiple_ref_combinations: A DataFrame containing combinations with multiple 'ref_id' values to check if there are any discrepancies for gamma values.
+def combination_groups(df, min_population=threshold):
     """
-    threshold = 5
-    # Ensure 'original_index' is present in the DataFrame
-    if 'original_index' not in df.columns:
-        raise ValueError("The input DataFrame must contain an 'original_index' column.")
-
-    # Filter out combinations with a population less than threshold
-    combination_counts = df.groupby(['IL_id', 'solute_id']).size().reset_index(name='counts')
-    df = df.merge(combination_counts, on=['IL_id', 'solute_id'])
-    df = df[df['counts'] >= threshold].drop(columns=['counts'])
-
-    # Get unique combinations of IL_id and solute_id
-    unique_combinations = df[['IL_id', 'solute_id']].drop_duplicates()
-
-    # Rank the unique combinations by the population count
-    gh_df = unique_combinations.copy()
-    gh_df['population'] = gh_df.apply(
-        lambda row: df[(df['IL_id'] == row['IL_id']) & 
-                       (df['solute_id'] == row['solute_id'])].shape[0], axis=1)
+    Group the rows of df by IL/solute combination in one pass and drop combinations with fewer than
+    min_population rows. After a stable sort by group code the rows of every combination are
+    contiguous (in their original order) and delimited by offsets.
+
+    Returns a dict with:
+        - table: IL_id, solute_id, population and group of every combination, in order of first appearance.
+        - lists: 'ref_id', 'original_index' and all other columns of df as one list of values per group.
+        - sorted_df: the rows of df sorted by group.
+        - offsets: group i holds the rows offsets[i]:offsets[i + 1] of sorted_df.
+    """
+    codes, populations = combination_codes(df)
+
+    # Filter out combinations with a population less than min_population
+    keep = populations >= min_population
+    keep_rows = np.append(keep, False)[codes]  # rows with a missing IL_id or solute_id (code -1) are dropped
+    df = df[keep_rows].reset_index(drop=True)
+    codes = (np.cumsum(keep) - 1)[codes[keep_rows]]
+    populations = populations[keep]
+    order = np.argsort(codes, kind='stable')
+    offsets = np.concatenate([[0], np.cumsum(populations)]).astype(np.int64)
+
+    # Unique combinations of IL_id and solute_id in order of first appearance
+    table = df.iloc[order[offsets[:-1]]][['IL_id', 'solute_id']].reset_index(drop=True)
+    table['population'] = populations
+    table['group'] = np.arange(len(table))
+
+    # 'ref_id', 'original_index' and all other original columns with the list of values of each combination
+    lists = pd.DataFrame(index=table.index)
+    for col in ['ref_id', 'original_index'] + df.columns.tolist():
+        if col not in table.columns and col not in lists.columns:
+            values = df[col].take(order).tolist()
+            lists[col] = pd.Series([values[start:end] for start, end in zip(offsets[:-1], offsets[1:])], index=lists.index, dtype=object)
+
+    return {'table': table, 'lists': lists, 'sorted_df': df.take(order), 'offsets': offsets}
+
+
+def rank_combinations(groups, regression, min_population=threshold):
+    """Rank the combinations of `groups` with at least min_population rows by population and attach their regression results."""
+    gh_df = groups['table'][groups['table']['population'] >= min_population]
     gh_df = gh_df.sort_values(by='population', ascending=False).reset_index(drop=True)
 
     # Assign unique rank numbers
     gh_df['unique_rank'] = range(1, len(gh_df) + 1)
 
-    # Add 'ref_id' column with a list of 'ref_id' values for each combination
-    gh_df['ref_id'] = gh_df.apply(
-        lambda row: df[(df['IL_id'] == row['IL_id']) & 
-                       (df['solute_id'] == row['solute_id'])]['ref_id'].tolist(), 
-        axis=1)
-
-    # Add 'original_index' column with a list of original indices for each combination
-    gh_df['original_index'] = gh_df.apply(
-        lambda row: df[(df['IL_id'] == row['IL_id']) & 
-                       (df['solute_id'] == row['solute_id'])]['original_index'].tolist(), 
-        axis=1)
-
-    # Include all original columns in the final DataFrame
-    original_columns = df.columns.tolist()
-    for col in original_columns:
-        if col not in gh_df.columns:
-            gh_df[col] = gh_df.apply(
-                lambda row: df[(df['IL_id'] == row['IL_id']) & 
-                               (df['solute_id'] == row['solute_id'])][col].tolist(),
-                axis=1
-            )
-
-       
-    
-    # Calculate intercept, slope, R-squared, t-test, p-value, rsd and normalized_mae for each combination       
-    def calculate_regression_params(row):
-        # Filter subset based on conditions
-        subset = df[(df['IL_id'] == row['IL_id']) & 
-                    (df['solute_id'] == row['solute_id'])].copy()
-        subset['inv_temp'] = 1 / subset['temperature']
-        subset['ln_gamma'] = np.log(subset[target])
-        
-        # Perform linear regression
-        slope, intercept, r_value, p_value, std_err = linregress(subset['inv_temp'], subset['ln_gamma'])
-        r_squared = r_value**2
-        
-        # Safeguard against invalid std_err
-        if std_err == 0:
-            t_stat = 0
-            t_p_value = 1  # p-value for zero slope, no relationship
-        else:
-            t_stat = slope / std_err
-            t_p_value = 2 * (1 - t.cdf(abs(t_stat), df=len(subset) - 2))
-        
-        # Calculate relative standard deviation (RSD) as a percentage
-        mean_ln_target = subset['ln_gamma'].mean()
-        std_ln_target = subset['ln_gamma'].std()
-        
-        # Handle cases with zero mean and non-zero standard deviation
-        if std_ln_target == 0:
-            rsd = 0  # No variation, set RSD to 0
-        elif mean_ln_target == 0:
-            # If mean is zero but standard deviation is non-zero, calculate RSD
-            rsd = (std_ln_target / subset['ln_gamma'].max()) * 100  # Use max of ln_target to avoid zero division
-        else:
-            rsd = (std_ln_target / mean_ln_target) * 100  # Relative Standard Deviation
-        
-        # Calculate Mean Absolute Error (MAE)
-        predicted_ln_target = intercept + slope * subset['inv_temp']
-        mae = np.mean(np.abs(subset['ln_gamma'] - predicted_ln_target))
-        
-        # Calculate absolute value of normalized MAE
-        if mean_ln_target == 0:
-            normalized_mae = abs(mae / subset['ln_gamma'].max())  # Use max of ln_target to avoid zero division
-        else:
-            normalized_mae = abs(mae / mean_ln_target)
-        
-        return pd.Series({
-            'intercept': intercept,
-            'slope': slope,
-            'r_squared': r_squared,
-            't_p_value': t_p_value,
-            'rsd': rsd,
-            'normalized_mae': normalized_mae,
-        })
-
-
-    def separate_entries(single_ref_combinations):
-        single_ref_combinations['unique_entry_id_count'] = single_ref_combinations['entry_id'].apply(lambda x: len(set(eval(str(x)))))
-        single_ref_multiple_entry = single_ref_combinations.loc[single_ref_combinations['unique_entry_id_count'] > 1].copy()
-        single_ref_multiple_entry.drop(columns=['unique_entry_id_count'], inplace=True)
-        single_ref_single_entry = single_ref_combinations.loc[single_ref_combinations['unique_entry_id_count'] == 1].copy()
-        single_ref_single_entry.drop(columns=['unique_entry_id_count'], inplace=True)
-        return single_ref_multiple_entry, single_ref_single_entry
-
-    regression_params = gh_df.apply(calculate_regression_params, axis=1)
-    gh_df = pd.concat([gh_df, regression_params], axis=1)
+    lists = groups['lists'].iloc[gh_df['group']].reset_index(drop=True)
+    regression_params = regression.iloc[gh_df['group']][REGRESSION_COLUMNS].reset_index(drop=True)
+    return pd.concat([gh_df.drop(columns=['group']), lists, regression_params], axis=1)
+
+
+def separate_entries(single_ref_combinations):
+    single_ref_combinations = single_ref_combinations.copy()
+    single_ref_combinations['unique_entry_id_count'] = single_ref_combinations['entry_id'].apply(lambda x: len(set(x)))
+    single_ref_multiple_entry = single_ref_combinations.loc[single_ref_combinations['unique_entry_id_count'] > 1].copy()
+    single_ref_multiple_entry.drop(columns=['unique_entry_id_count'], inplace=True)
+    single_ref_single_entry = single_ref_combinations.loc[single_ref_combinations['unique_entry_id_count'] == 1].copy()
+    single_ref_single_entry.drop(columns=['unique_entry_id_count'], inplace=True)
+    return single_ref_multiple_entry, single_ref_single_entry
 
+
+def split_combinations(gh_df):
+    """Split gh_df into multiple-ref, single-ref/multiple-entry and single-ref/single-entry combinations."""
     # Identify combinations with multiple 'ref_id' values
     multiple_ref_combinations = gh_df[gh_df['ref_id'].apply(lambda x: len(set(x)) > 1)]
     single_ref_combinations = gh_df[gh_df['ref_id'].apply(lambda x: len(set(x)) == 1)]
 
-    # Save gh_df, multiple_ref_combinations, single_ref_combinations to CSV files
-    intermediate_dir = os.path.join(os.path.dirname(__file__), 'Intermediate_Data')
-    os.makedirs(intermediate_dir, exist_ok=True)
-    
-    gh_df.to_csv(os.path.join(intermediate_dir, 'step8_gh_total.csv'), index=False)
-    multiple_ref_combinations.to_csv(os.path.join(intermediate_dir, 'step8_gh_multiple_ref_combinations.csv'), index=False)
-
     # sanity check for the sum population column for gh_df, single_ref_combinations and multiple_ref_combinations
     if gh_df['population'].sum() == single_ref_combinations['population'].sum() + multiple_ref_combinations['population'].sum():
         print("Sanity check passed: population sum of gh_df is equal to the sum of population of single_ref_combinations and multiple_ref_combinations.")
@@ -158,18 +98,76 @@ def gibbs_helmholtz_coefficients(df, target = 'gamma'):
     else:
         print("Sanity check failed: population sum of single_ref_combinations is not equal to the sum of population of single_ref_multiple_entry and single_ref_single_entry.")
 
-    # save single_ref_multiple_entry and single_ref_single_entry to CSV files
-    single_ref_multiple_entry.to_csv(os.path.join(intermediate_dir, 'step8_single_ref_multiple_entry.csv'), index=False)
-    single_ref_single_entry.to_csv(os.path.join(intermediate_dir, 'step8_single_ref_single_entry.csv'), index=False)
+    return multiple_ref_combinations, single_ref_multiple_entry, single_ref_single_entry
+
+
+def save_results(results, suffix=''):
+    """Save the four step8 tables (per-combination lists are stored as native list columns)."""
+    names = ['step8_gh_total', 'step8_gh_multiple_ref_combinations', 'step8_single_ref_multiple_entry', 'step8_single_ref_single_entry']
+    for table, name in zip(results, names):
+        save_intermediate(table, name + suffix)
+
+
+def gibbs_helmholtz_batch(df, targets=('gamma',), thresholds=(threshold,), save=False):
+    """
+    Runs step8 for every combination of targets and thresholds. The grouping is computed once for
+    the smallest threshold and the regression once per target; each threshold only selects the
+    combinations that reach it.
+
+    Args:
+        df: The input DataFrame.
+        targets: Names of the target columns for analysis.
+        thresholds: Minimum populations of the combinations.
+        save: Whether to save every result set to Intermediate_Data (names suffixed with _<target>_min<threshold>).
+
+    Returns:
+        A dict mapping (target, threshold) to the tuple returned by gibbs_helmholtz_coefficients.
+    """
+    # Ensure 'original_index' is present in the DataFrame
+    if 'original_index' not in df.columns:
+        raise ValueError("The input DataFrame must contain an 'original_index' column.")
+
+    groups = combination_groups(df, min(thresholds))
+    results = {}
+    for target in targets:
+        # Intercept, slope, R-squared, t-test p-value, rsd and normalized_mae of all combinations in one batched fit
+        regression = gibbs_helmholtz_regression(groups['sorted_df']['temperature'], groups['sorted_df'][target], groups['offsets'])
+        for min_population in thresholds:
+            gh_df = rank_combinations(groups, regression, min_population)
+            results[(target, min_population)] = (gh_df, *split_combinations(gh_df))
+            if save:
+                save_results(results[(target, min_population)], f'_{target}_min{min_population}')
+    return results
+
+
+def gibbs_helmholtz_coefficients(df, target = 'gamma', threshold=threshold, save=True):
+    """
+    Processes the input DataFrame, filters out combinations with fewer than threshold occurrences, 
+    ranks combinations by population, and creates new DataFrames with 'ref_id' values 
+    for each combination.
 
-    return gh_df, multiple_ref_combinations, single_ref_multiple_entry, single_ref_single_entry
+    Args:
+        df: The input DataFrame.
+        target: The name of the target column for analysis.
+        threshold: Minimum population of the combinations.
+        save: Whether to save the resulting DataFrames to Intermediate_Data.
+
+    Returns:
+        A tuple containing:
+            - gh_df: A DataFrame containing the ranked combinations and slope and intercept of Gibbs-Helmholtz equation.
+            - multiple_ref_combinations: A DataFrame containing combinations with multiple 'ref_id' values to check if there are any discrepancies for gamma values.
+            - single_ref_multiple_entry, single_ref_single_entry: single-ref combinations with several or one entry_id.
+    """
+    results = gibbs_helmholtz_batch(df, [target], [threshold])[(target, threshold)]
+    if save:
+        save_results(results)
+    return results
 
 
 
 
 if __name__ == "__main__":
-    data_path = 'Intermediate_Data/step7_activity_data_elements_filtered.csv'
-    df = pd.read_csv(data_path)
+    df = load_intermediate('step7_activity_data_elements_filtered')
     # Process data and save ranked combinations
     total_combinations, multiple_ref_combinations, single_ref_multiple_entry, single_ref_single_entry = gibbs_helmholtz_coefficients(df)
 
@@ -1,88 +1,79 @@
 import os
-import json
 import pandas as pd
-from collections import defaultdict
-from scipy.stats import linregress
+from collections import Counter
 import numpy as np
-import ast
 import statsmodels.api as sm
 from scipy import stats
 from itertools import combinations
 import random
+from gh_regression import ragged, gibbs_helmholtz_regression
+from intermediate_store import load_intermediate, save_intermediate
 
 
 threshold = 5
 
-def load_dataset(file_path):
-    return pd.read_csv(file_path)
+def load_dataset(name):
+    return load_intermediate(name)
+
+GROUP_KEYS = ['ref_id', 'original_index', 'temperature', 'gamma']
+
+def ref_groups(ref_ids):
+    """
+    Groups the points of one combination by ref_id with a single stable argsort. Refs are visited in
+    the order of set(ref_ids): refs with at least threshold points become group_0, group_1, ... and
+    the points of all smaller refs form the pseudo_group (named where its first ref is visited).
+    Returns the point order and a dict group_name -> (start, end) slice of that order; within a group
+    the points of each ref keep their original order.
+    """
+    refs = list(set(ref_ids))
+    position = {rid: k for k, rid in enumerate(refs)}
+    codes = np.fromiter((position[rid] for rid in ref_ids), dtype=np.int64, count=len(ref_ids))
+    counts = np.bincount(codes, minlength=len(refs))
+    large = counts >= threshold
+
+    # Renumber the refs so that the large ones come first and the pseudo-group refs last (each in set order)
+    ranking = np.argsort(~large, kind='stable')
+    rank = np.empty_like(ranking)
+    rank[ranking] = np.arange(len(refs))
+    order = np.argsort(rank[codes], kind='stable')
+    bounds = np.concatenate([[0], np.cumsum(counts[ranking])])
+
+    n_large = int(large.sum())
+    slices = {f'group_{g}': (bounds[g], bounds[g + 1]) for g in range(n_large)}
+    if n_large < len(refs):
+        names = list(slices)
+        names.insert(int(large[:np.argmin(large)].sum()), 'pseudo_group')
+        slices['pseudo_group'] = (bounds[n_large], bounds[-1])
+        slices = {name: slices[name] for name in names}
+    return order, slices
 
 def process_row(row):
-    def safe_json_loads(value):
-        """Ensure json.loads is only applied to string values."""
-        return json.loads(value) if isinstance(value, str) else value
-
-    # Apply safe_json_loads to each relevant column
-    ref_ids = safe_json_loads(row['ref_id'])
-    original_indices = safe_json_loads(row['original_index'])
-    temperatures = safe_json_loads(row['temperature'])
-    gammas = safe_json_loads(row['gamma'])
-    
-    ref_counts = {rid: ref_ids.count(rid) for rid in set(ref_ids)}
-    groups = defaultdict(lambda: {'ref_id': [], 'original_index': [], 'temperature': [], 'gamma': []})
-    
-    groups['general_group'] = {
-        'ref_id': ref_ids,
-        'original_index': original_indices,
-        'temperature': temperatures,
-        'gamma': gammas
-    }
-    
-    group_idx = 0
-    has_sedu_group = False
-    for rid, count in ref_counts.items():
-        group_name = f'group_{group_idx}' if count >= threshold else 'pseudo_group'
-        if count >= threshold:
-            group_idx += 1
-        else:
-            has_sedu_group = True
-        
-        for i, rid_val in enumerate(ref_ids):
-            if rid_val == rid:
-                groups[group_name]['ref_id'].append(rid_val)
-                groups[group_name]['original_index'].append(original_indices[i])
-                groups[group_name]['temperature'].append(temperatures[i])
-                groups[group_name]['gamma'].append(gammas[i])
-    
-    if has_sedu_group:
-        groups['pseudo_group'] = {'ref_id': [], 'original_index': [], 'temperature': [], 'gamma': []}
-        for rid, count in ref_counts.items():
-            if count < threshold:
-                for i, rid_val in enumerate(ref_ids):
-                    if rid_val == rid:
-                        groups['pseudo_group']['ref_id'].append(rid_val)
-                        groups['pseudo_group']['original_index'].append(original_indices[i])
-                        groups['pseudo_group']['temperature'].append(temperatures[i])
-                        groups['pseudo_group']['gamma'].append(gammas[i])
-    
+    # step8 stores the values of each combination as native lists
+    values = {key: list(row[key]) for key in GROUP_KEYS}
+    order, slices = ref_groups(values['ref_id'])
+
+    groups = {'general_group': values}
+    grouped = {key: np.asarray(values[key], dtype=object)[order] for key in GROUP_KEYS}
+    for group_name, (start, end) in slices.items():
+        groups[group_name] = {key: grouped[key][start:end].tolist() for key in GROUP_KEYS}
     return groups
 
-def calculate_regression(data):
-    temperatures = np.array(data['temperature'])
-    gammas = np.array(data['gamma'])
-    
-    if np.any(temperatures == 0):
-        return None, None, None
-    
-    x = 1 / temperatures
-    y = np.log(gammas)
-    
-    slope, intercept, r_value, _, _ = linregress(x, y)
-    return slope, intercept, r_value**2
+def calculate_regression(groups):
+    """
+    Fits ln(gamma) against 1/temperature for a list of groups in one batched regression.
+    Returns (slope, intercept, r2) per group; None for groups with a zero temperature.
+    """
+    temperatures, offsets = ragged([data['temperature'] for data in groups])
+    gammas, _ = ragged([data['gamma'] for data in groups])
+    regression = gibbs_helmholtz_regression(temperatures, gammas, offsets)
+    return [(None, None, None) if np.any(np.asarray(data['temperature'], dtype=float) == 0) else (slope, intercept, r2)
+            for data, slope, intercept, r2 in zip(groups, regression['slope'], regression['intercept'], regression['r_squared'])]
 
 def process_data(df):
+    # processed_data holds the position of every combination in df with its groups
     processed_data = []
     failed_rows = []
-    for _, row in df.iterrows():
+    for position, (_, row) in enumerate(df.iterrows()):
         row_groups = process_row(row)
         general_count = len(row_groups['general_group']['ref_id'])
         other_count = sum(len(data['ref_id']) for group, data in row_groups.items() if group != 'general_group')
@@ -90,24 +81,14 @@ def process_data(df):
         if general_count != other_count:
             failed_rows.append(row)
         else:
-            processed_data.append(row_groups)
+            processed_data.append((position, row_groups))
     
     return processed_data, failed_rows
 
-def expand_rows(processed_data):
-    expanded_rows = []
-    for row_groups in processed_data:
-        row_dict = {}
-        for group_name, data in row_groups.items():
-            for key, values in data.items():
-                row_dict[f'{key}_{group_name}'] = json.dumps(values) if key not in ['slope', 'intercept', 'r2'] else values
-        expanded_rows.append(row_dict)
-    return expanded_rows
-
 def save_failed_rows(failed_rows, name):
     if failed_rows:
         failed_df = pd.DataFrame(failed_rows)
-        failed_file = f'Intermediate_Data/step9_failed_rows_while_generating_groups_{name}.csv'
+        failed_file = f'Intermediate_Data/step9_failed_rows_while_generating_groups_{name}.csv'  # report only
         failed_df.to_csv(failed_file, index=False)
         print(f'Failed rows saved to {failed_file}')
         print('Sanity check failed.')
@@ -115,68 +96,34 @@ def save_failed_rows(failed_rows, name):
         print('Sanity check passed.')
 
 def add_regression_results(processed_data):
-    for row_groups in processed_data:
+    # The groups of all combinations are fitted together; small pseudo groups are not fitted
+    fitted = [data for _, row_groups in processed_data for group_name, data in row_groups.items()
+              if not (group_name == 'pseudo_group' and len(data['ref_id']) < threshold)]
+    results = {id(data): result for data, result in zip(fitted, calculate_regression(fitted))}
+    for _, row_groups in processed_data:
         for group_name, data in row_groups.items():
-            if group_name == 'pseudo_group' and len(data['ref_id']) < threshold:
-                slope, intercept, r2 = None, None, None
-            else:
-                slope, intercept, r2 = calculate_regression(data)
+            slope, intercept, r2 = results.get(id(data), (None, None, None))
             row_groups[group_name]['slope'] = slope
             row_groups[group_name]['intercept'] = intercept
             row_groups[group_name]['r2'] = r2
 
-def save_processed_data(expanded_rows, name):
-    processed_df = pd.DataFrame(expanded_rows)
-    output_file = f'Intermediate_Data/step9_regression_params_added_{name}.csv'
-    processed_df.to_csv(output_file, index=False)
-    print(f'Processed data with regression results saved to {output_file}')
-    return processed_df
-
-def filter_columns(processed_df):
-    group_columns = [col for col in processed_df.columns if 'ref_id_group_' in col]
-    group_columns.append('ref_id_pseudo_group')
-    group_columns.extend([col for col in processed_df.columns if 'original_index_group_' in col])
-    group_columns.append('original_index_pseudo_group')
-    group_columns.extend([col for col in processed_df.columns if 'temperature_group_' in col])
-    group_columns.append('temperature_pseudo_group')
-    group_columns.extend([col for col in processed_df.columns if 'gamma_group_' in col])
-    group_columns.append('gamma_pseudo_group')
-    group_columns.extend([col for col in processed_df.columns if 'r2_' in col])
-    return processed_df[group_columns]
-
-def calculate_ln_and_inv(processed_df):
-    for col in processed_df.columns:
-        if 'gamma_group_' in col or col == 'gamma_pseudo_group':
-            processed_df[f'ln_{col}'] = processed_df[col].apply(lambda x: [np.log(float(i)) for i in json.loads(x)] if isinstance(x, str) else x)
-        if 'temperature_group_' in col or col == 'temperature_pseudo_group':
-            processed_df[f'inv_{col}'] = processed_df[col].apply(lambda x: [1/float(i) for i in json.loads(x)] if isinstance(x, str) else x)
-    return processed_df
-
-def rename_pseudo_group(processed_df):
-    group_numbers = [int(col.split('_')[-1]) for col in processed_df.columns if col.split('_')[-1].isdigit()]
-    last_group_number = max(group_numbers) if group_numbers else 0
-    for col in processed_df.columns:
-        if 'pseudo_group' in col:
-            new_col_name = col.replace('pseudo_group', f'group_{last_group_number + 1}')
-            processed_df.rename(columns={col: new_col_name}, inplace=True)
-    return processed_df
-
-def save_filtered_data(processed_df, name):
-    output_file = f'Intermediate_Data/step9_filtered_grouped_data_{name}.csv'
-    processed_df.to_csv(output_file, index=False)
-    print('Filtered DataFrame saved to step9_filtered_grouped_data.csv')
-
-def convert_str_to_list(processed_df):
-    for col in processed_df.columns:
-        if col.startswith("inv_temperature_group_") or col.startswith("ln_gamma_group_"):
-            processed_df[col] = processed_df[col].apply(lambda x: ast.literal_eval(x) if isinstance(x, str) else x)
-    return processed_df
-
-def ensure_list_values(processed_df):
-    for col in processed_df.columns:
-        if col.startswith("inv_temperature_group_") or col.startswith("ln_gamma_group_"):
-            processed_df[col] = processed_df[col].apply(lambda x: [x] if isinstance(x, (int, float)) and not np.isnan(x) else x)
-    return processed_df
+def id_columns(df):
+    return [col for col in ['IL_id', 'solute_id'] if col in df.columns]
+
+def group_rows(df, processed_data):
+    """Long table with one row per (combination, group): the points of the group and its regression results."""
+    ids = id_columns(df)
+    rows = []
+    for position, row_groups in processed_data:
+        combination = {'combination': position, **{col: df[col].iat[position] for col in ids}}
+        for group_name, data in row_groups.items():
+            rows.append({**combination, 'group': group_name, **data})
+    groups = pd.DataFrame(rows, columns=['combination'] + ids + ['group'] + GROUP_KEYS + ['slope', 'intercept', 'r2'])
+    return groups.astype({'slope': float, 'intercept': float, 'r2': float})
+
+def group_rank(group_name):
+    # Order of the groups of a combination in the Chow tests and the selection: group_0, group_1, ..., pseudo_group
+    return np.inf if group_name == 'pseudo_group' else int(group_name.split('_')[-1])
 
 def chow_test(x1, y1, x2, y2):
     x1, y1, x2, y2 = np.array(x1), np.array(y1), np.array(x2), np.array(y2)
@@ -214,148 +161,113 @@ def chow_test(x1, y1, x2, y2):
 
 
 
-def apply_chow_test(processed_df):
-    num_groups = len([col for col in processed_df.columns if col.startswith("r2_group_")])
-    group_combinations = list(combinations(range(num_groups), 2))
-
-    for g1, g2 in group_combinations:
-        processed_df[f"F_group_{g1}_{g2}"] = np.nan
-        processed_df[f"p_group_{g1}_{g2}"] = np.nan
-        processed_df[f"s_group_{g1}_{g2}"] = np.nan
-
-    for index, row in processed_df.iterrows():
-        for g1, g2 in group_combinations:
-            x1, y1 = row.get(f"inv_temperature_group_{g1}"), row.get(f"ln_gamma_group_{g1}")
-            x2, y2 = row.get(f"inv_temperature_group_{g2}"), row.get(f"ln_gamma_group_{g2}")
-
-            if not isinstance(x1, list) or not isinstance(y1, list) or not isinstance(x2, list) or not isinstance(y2, list) or len(x1) < threshold or len(y1) < threshold or len(x2) < threshold or len(y2) < threshold:
-                continue
-
-            if len(x1) != len(y1) or len(x2) != len(y2):
-                continue
-
-            F_stat, p_value, significant = chow_test(x1, y1, x2, y2)
-            processed_df.loc[index, f"F_group_{g1}_{g2}"] = F_stat
-            processed_df.loc[index, f"p_group_{g1}_{g2}"] = p_value
-            processed_df.loc[index, f"s_group_{g1}_{g2}"] = float(significant)
-
-    return processed_df
-
-def count_false_contributions(processed_df):
-    num_groups = len([col for col in processed_df.columns if col.startswith("r2_group_")])
-    for g in range(num_groups):
-        processed_df[f"False_count_group_{g}"] = 0
-
-    for index, row in processed_df.iterrows():
-        false_counts = {g: 0 for g in range(num_groups)}
-        for g1, g2 in list(combinations(range(num_groups), 2)):
-            if row[f"s_group_{g1}_{g2}"] == 0:
-                false_counts[g1] += 1
-                false_counts[g2] += 1
-        for g in range(num_groups):
-            processed_df.at[index, f"False_count_group_{g}"] = false_counts[g]
-
-    return processed_df
-
-def get_group_stats(row, group):
-    gamma_values = row[f"ln_gamma_group_{group}"]
-    if isinstance(gamma_values, list):
-        max_gamma = max(gamma_values)
-        num_samples = len(gamma_values)
-    else:
-        max_gamma = None
-        num_samples = 0
-    return max_gamma, num_samples
+def apply_chow_test(groups):
+    """
+    Long table with one row per (combination, group pair) for the pairs of groups that both have at
+    least threshold points: F statistic, p-value and significance (1.0/0.0) of the Chow test.
+    """
+    tested = groups[(groups['group'] != 'general_group') & (groups['gamma'].map(len) >= threshold)]
+    tested = tested.assign(rank=tested['group'].map(group_rank)).sort_values(['combination', 'rank'], kind='stable')
+    ids = id_columns(groups)
+
+    pairs = []
+    for _, members in tested.groupby('combination', sort=False):
+        combination = members.iloc[0][['combination'] + ids].to_dict()
+        names = members['group'].tolist()
+        inv_temperatures = [1 / np.asarray(values, dtype=float) for values in members['temperature']]
+        ln_gammas = [np.log(np.asarray(values, dtype=float)) for values in members['gamma']]
+        for g1, g2 in combinations(range(len(names)), 2):
+            F_stat, p_value, significant = chow_test(inv_temperatures[g1], ln_gammas[g1], inv_temperatures[g2], ln_gammas[g2])
+            pairs.append({**combination, 'group_1': names[g1], 'group_2': names[g2], 'F_stat': F_stat, 'p_value': p_value,
+                          'significant': np.nan if significant is None else float(significant)})
+
+    pairs = pd.DataFrame(pairs, columns=['combination'] + ids + ['group_1', 'group_2', 'F_stat', 'p_value', 'significant'])
+    return pairs.astype({'F_stat': float, 'p_value': float, 'significant': float})
+
+def count_false_contributions(groups, pairs):
+    # Number of Chow tests in which a group agrees (no significant difference) with another group of its combination
+    agreeing = pairs[pairs['significant'] == 0]
+    false_counts = Counter(zip(agreeing['combination'], agreeing['group_1'])) + Counter(zip(agreeing['combination'], agreeing['group_2']))
+    groups['False_count'] = [false_counts.get(key, 0) for key in zip(groups['combination'], groups['group'])]
+    return groups
 
-def get_group_r2_adjusted(row, group):
-    r2 = row.get(f"r2_group_{group}", None)
-    _, num_samples = get_group_stats(row, group)
+def get_group_r2_adjusted(r2, num_samples):
     if r2 is not None and num_samples > 1:
         adjusted_r2 = 1 - (1 - r2) * (num_samples - 1) / (num_samples - 2)
         return adjusted_r2
     return None
 
-def determine_selected_group(processed_df):
-    selected_groups = []
-    
-    for index, row in processed_df.iterrows():
-        num_groups = len([col for col in processed_df.columns if col.startswith("r2_group_")])
-        false_counts = {g: row[f"False_count_group_{g}"] for g in range(num_groups)}
-        max_false_count = max(false_counts.values())
-
-        if max_false_count == 0:
-            if row["r2_general_group"] > 0.9:
-                r2_columns = [col for col in processed_df.columns if col.startswith("r2_group_")]
-                non_null_r2_columns = [col for col in r2_columns if pd.notnull(row[col])]
-                if len(non_null_r2_columns) == 1:
-                    selected_groups.append(int(non_null_r2_columns[0].split("_")[-1]))
-                    continue
-                r2_values = {g: get_group_r2_adjusted(row, g) for g in range(num_groups)}
-                max_r2 = max([r2 for r2 in r2_values.values() if r2 is not None])
-                candidates = [g for g, r2 in r2_values.items() if r2 == max_r2]
-                if len(candidates) == 1:
-                    selected_groups.append(candidates[0])
-                    continue
-                gamma_values = {g: get_group_stats(row, g)[0] for g in candidates}
-                if gamma_values:
-                    max_gamma = max(gamma_values.values())
-                    candidates = [g for g, gamma in gamma_values.items() if gamma == max_gamma]
-                    if len(candidates) == 1:
-                        selected_groups.append(candidates[0])
-                        continue
+def select_group(false_counts, r2s, max_gammas, num_samples, r2_general):
+    """
+    Selects the group of one combination. The dicts map the group names (in group_rank order) to the
+    number of agreeing Chow tests, R-squared, maximum ln(gamma) and number of samples of each group.
+    Returns the selected group name or None.
+    """
+    max_false_count = max(false_counts.values())
+
+    if max_false_count == 0:
+        if not r2_general > 0.9:
+            return None
+        non_null_r2_groups = [g for g, r2 in r2s.items() if pd.notnull(r2)]
+        if len(non_null_r2_groups) == 1:
+            return non_null_r2_groups[0]
+        r2_values = {g: get_group_r2_adjusted(r2s[g], num_samples[g]) for g in false_counts}
+        max_r2 = max([r2 for r2 in r2_values.values() if r2 is not None])
+        candidates = [g for g, r2 in r2_values.items() if r2 == max_r2]
+        if len(candidates) == 1:
+            return candidates[0]
+        gamma_values = {g: max_gammas[g] for g in candidates}
+        if not gamma_values:
+            return None
+    else:
+        candidates = [g for g, count in false_counts.items() if count == max_false_count]
+        if len(candidates) == 1:
+            if candidates[0] == 'pseudo_group' and r2s[candidates[0]] <= 0.9:  # if the selected group is the pseudo group and the r2 value is less than 0.9 then we need to select another group since the sedu group is not reliable because it has a lot of variance that share many datapoint with other groups
+                next_max_false_count = max(count for g, count in false_counts.items() if count < max_false_count)
+                if next_max_false_count >= 2:  # if the next max false count is not greater than 2 then it means it only shares datapoints with unreliable pseudo group
+                    candidates = [g for g, count in false_counts.items() if count == next_max_false_count]
                 else:
-                    selected_groups.append(None)
-                    continue
-                sample_counts = {g: get_group_stats(row, g)[1] for g in candidates}
-                max_samples = max(sample_counts.values())
-                candidates = [g for g, samples in sample_counts.items() if samples == max_samples]
-                selected_groups.append(random.choice(candidates))
-            else:
-                selected_groups.append(None)
-        else:
-            candidates = [g for g, count in false_counts.items() if count == max_false_count]
-            if len(candidates) == 1:
-                if candidates[0] == max(false_counts.keys()) and row[f"r2_group_{candidates[0]}"] <= 0.9:  # if the selected group is the pseudo group and the r2 value is less than 0.9 then we need to select another group since the sedu group is not reliable because it has a lot of variance that share many datapoint with other groups
-                    next_max_false_count = max(count for g, count in false_counts.items() if count < max_false_count)
-                    if next_max_false_count >= 2:  # if the next max false count is not greater than 2 then it means it only shares datapoints with unreliable pseudo group
-                        candidates = [g for g, count in false_counts.items() if count == next_max_false_count]
-                    else:
-                        selected_groups.append(None)
-                        continue
-            r2_values = {g: get_group_r2_adjusted(row, g) for g in candidates}
-            max_r2 = max(r2_values.values())
-            candidates = [g for g, r2 in r2_values.items() if r2 == max_r2]
-            if len(candidates) == 1:
-                selected_groups.append(candidates[0])
-                continue
-            gamma_values = {g: get_group_stats(row, g)[0] for g in candidates}
-            max_gamma = max(gamma_values.values())
-            candidates = [g for g, gamma in gamma_values.items() if gamma == max_gamma]
-            if len(candidates) == 1:
-                selected_groups.append(candidates[0])
-                continue
-            sample_counts = {g: get_group_stats(row, g)[1] for g in candidates}
-            max_samples = max(sample_counts.values())
-            candidates = [g for g, samples in sample_counts.items() if samples == max_samples]
-            selected_groups.append(random.choice(candidates))
-
-    processed_df["selected_group"] = selected_groups
-    return processed_df
+                    return None
+        r2_values = {g: get_group_r2_adjusted(r2s[g], num_samples[g]) for g in candidates}
+        max_r2 = max(r2_values.values())
+        candidates = [g for g, r2 in r2_values.items() if r2 == max_r2]
+        if len(candidates) == 1:
+            return candidates[0]
+        gamma_values = {g: max_gammas[g] for g in candidates}
+
+    max_gamma = max(gamma_values.values())
+    candidates = [g for g, gamma in gamma_values.items() if gamma == max_gamma]
+    if len(candidates) == 1:
+        return candidates[0]
+    sample_counts = {g: num_samples[g] for g in candidates}
+    max_samples = max(sample_counts.values())
+    candidates = [g for g, samples in sample_counts.items() if samples == max_samples]
+    return random.choice(candidates)
+
+def determine_selected_group(groups):
+    """Marks the selected group of every combination in the 'selected' column."""
+    ranked = groups.assign(rank=groups['group'].map(lambda g: -1 if g == 'general_group' else group_rank(g)))
+    ranked = ranked.sort_values(['combination', 'rank'], kind='stable')
+    selected = set()
+    for combination, members in ranked.groupby('combination', sort=False):
+        r2_general = members['r2'].to_numpy()[0]
+        members = members.iloc[1:]
+        names = members['group'].tolist()
+        selected_group = select_group(dict(zip(names, members['False_count'].tolist())),
+                                      dict(zip(names, members['r2'].to_numpy())),
+                                      dict(zip(names, [max(np.log(np.asarray(values, dtype=float)).tolist()) for values in members['gamma']])),
+                                      dict(zip(names, members['gamma'].map(len).tolist())),
+                                      r2_general)
+        selected.add((combination, selected_group))
+    groups['selected'] = [key in selected for key in zip(groups['combination'], groups['group'])]
+    return groups
 
 
 def process_entry_id_column(df):
     # the aim of this function is to prepare single ref multiple entry data for conflict handling without changing the complicated conflict_handling function
     # Function to check and convert string representation of lists to actual lists
-    def parse_entry_id(entry):
-        if isinstance(entry, str):  # If it's a string, assume it's a list in string format
-            try:
-                # Convert string to actual list (only works if it's a valid list string)
-                return eval(entry)
-            except:
-                return []  # Return an empty list if eval fails
-        return entry  # If it's already a list, return as-is
-
-    df['entry_id'] = df['entry_id'].apply(parse_entry_id)
+    # entry_id holds native lists (see step8); missing values become empty lists
+    df['entry_id'] = df['entry_id'].apply(lambda entry: entry if isinstance(entry, list) else [])
 
     all_unique_values = sorted(set(value for sublist in df['entry_id'] for value in sublist))
 
@@ -373,43 +285,36 @@ def process_entry_id_column(df):
 
 
 
-def conflict(df, name):
+def conflict(df, name, save=True):
     processed_data, failed_rows = process_data(df)
-    save_failed_rows(failed_rows, name)
+    if save:
+        save_failed_rows(failed_rows, name)
 
     add_regression_results(processed_data)
-    expanded_rows = expand_rows(processed_data)
-    df = save_processed_data(expanded_rows, name)
-
-    df = filter_columns(df)
-    df = calculate_ln_and_inv(df)
-    df = rename_pseudo_group(df)
-    save_filtered_data(df, name)
+    groups = group_rows(df, processed_data)
 
     random.seed(42)
-    df = convert_str_to_list(df)
-    df = ensure_list_values(df)
-    df = apply_chow_test(df)
-    df = count_false_contributions(df)
-    df = determine_selected_group(df)
-
-    output_path = f'Intermediate_Data/step9_conflicted_data_resolved_{name}.csv'
-    df.to_csv(output_path, index=False)
-    print(f'Processed data with selected group saved to {output_path}')
-    return df
+    pairs = apply_chow_test(groups)
+    groups = count_false_contributions(groups, pairs)
+    groups = determine_selected_group(groups)
+
+    if save:
+        pairs_path = save_intermediate(pairs, f'step9_group_pairs_{name}')
+        print(f'Chow test results of the group pairs saved to {pairs_path}')
+        output_path = save_intermediate(groups, f'step9_conflicted_data_resolved_{name}')
+        print(f'Processed data with selected group saved to {output_path}')
+    return groups, pairs
 
 
-def conflict_handling(df1, df2, name1, name2):
-    df1 = conflict(df1, name1)
+def conflict_handling(df1, df2, name1, name2, save=True):
+    df1, pairs1 = conflict(df1, name1, save=save)
     df2 = process_entry_id_column(df2)
-    df2 = conflict(df2, name2)
-    return df1, df2
+    df2, pairs2 = conflict(df2, name2, save=save)
+    return df1, df2, pairs1, pairs2
 
 if __name__ == "__main__":
-    file_path1 = 'Intermediate_Data/step8_gh_multiple_ref_combinations.csv'
-    file_path2 = 'Intermediate_Data/step8_single_ref_multiple_entry.csv'
-    df1 = pd.read_csv(file_path1)
-    df2 = pd.read_csv(file_path2)
+    df1 = load_dataset('step8_gh_multiple_ref_combinations')
+    df2 = load_dataset('step8_single_ref_multiple_entry')
     df1 = process_entry_id_column(df1)
     df2 = process_entry_id_column(df2)
     conflict_handling(df1, df2, 'multi', 'single')